@@ -9,18 +9,39 @@ load_dotenv()
 
 import sys
 import json
+import logging
 from urllib.parse import quote_plus, urlencode
-from authlib.integrations.flask_client import OAuth
-from flask import Flask, render_template, request, redirect, url_for, jsonify, abort, session
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, abort, session
+from flask import stream_with_context
 from flask_migrate import Migrate
 from flask_cors import CORS
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from flask_sqlalchemy import SQLAlchemy
 
-from model import db, create_tables, Movie, Actor, Cast
-from model import queryCastByActor, queryMovieByActor, setup_db
-
-from auth import AuthError, requires_auth
+from model import db, create_tables, init_db_command, Movie, Actor, Cast, Job
+from model import queryCastByMovie, queryCastByMovies, queryPortfolioByActor, setup_db
+from model import queryMoviePage, queryActorPage
+from model import SEARCH_LIMIT, SEARCH_MAX_LIMIT, querySearchMovies, querySearchActors
+from model import queryActorIdsByMovie, queryActorsByIds, queryMoviesByIds
+from model import queryMovieVersion, queryActorVersion, touchVersions
+from cache import response_cache
+from dbpool import pool_status
+from metrics import request_metrics
+from routing import read_only, replica_router
+from pagination import PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, page_args
+from bulk import BULK_MAX_ITEMS, create_movies, create_actors, create_casts, delete_movies, delete_actors
+from graph import COSTAR_LIMIT, COSTAR_MAX_DEPTH, GraphUnavailable, costar_graph
+from jobs import JOB_KINDS, JOB_INLINE_MAX_ITEMS, enqueue, job_status, job_worker, run_jobs_command
+from ingest import FORMATS, IngestError, ingest, import_catalogue_command
+from export import FORMATS as EXPORT_FORMATS, export_rows, export_catalogue_command
+from serializers import FastJSONProvider, movie_serializer, actor_serializer, cast_serializer
+from serializers import cast_member_serializer, portfolio_serializer
+from session_store import make_session_interface, session_user
+
+from auth import AuthError, requires_auth, requires_metrics_access, check_permissions, oauth_metadata, token_cache
+from logs import setup_logging
+
+logger = logging.getLogger(__name__)
 
 
 #----------------------------------------------------------------------------#
@@ -29,45 +50,79 @@ from auth import AuthError, requires_auth
 
 def create_app(test_config=None):
     # create and configure the app
+    setup_logging()
     app = Flask(__name__)
-    setup_db(app)
+    # orjson based encoding of jsonify responses, when orjson is installed
+    app.json = FastJSONProvider(app)
     app.secret_key = env.get("APP_SECRET_KEY")
+    # Session data on the server, the cookie only carries the session id
+    session_interface = make_session_interface()
+    if session_interface:
+        app.session_interface = session_interface
 
+    # The config is loaded before setup_db, so its engine (pool) options are applied
     if test_config:
         app.config.from_object(test_config) 
-        print("Testing Mode")
+        logger.info("Testing Mode")
     else:
         app.config.from_object("config.ProductionConfig")
-        print("Production Mode")
-
-    print("applied db URL = ", app.config['SQLALCHEMY_DATABASE_URI'])
+        logger.info("Production Mode")
+    setup_db(app)
+    replica_router.init_app(app, db)
+    # Timing, SQL and auth cost per request: Server-Timing header and /metrics
+    request_metrics.init_app(app)
+    # Worker threads for the background jobs, see jobs.py
+    job_worker.init_app(app)
+    # In-memory co-star graph, see graph.py
+    costar_graph.init_app(app)
+
+    # The password in the URL is redacted by the logging setup
+    logger.info("applied db URL = %s", app.config['SQLALCHEMY_DATABASE_URI'])
     
     CORS(app)
-    db.init_app(app)
     migrate = Migrate(app, db)
 
-    oauth = OAuth(app)
-    oauth.register(
-        "auth0",
-        client_id=env.get("AUTH0_CLIENT_ID"),
-        client_secret=env.get("AUTH0_CLIENT_SECRET"),
-        client_kwargs={
-            "scope": "openid profile email",
-        },
-        server_metadata_url=f'https://{env.get("AUTH0_DOMAIN")}/.well-known/openid-configuration'
-    )
+    # Creating the schema is an explicit step: flask init-db (or flask db upgrade)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(import_catalogue_command)
+    app.cli.add_command(export_catalogue_command)
+    app.cli.add_command(run_jobs_command)
+
+    # The OAuth client (and authlib) is only loaded at the first login, the API
+    # doesn't need it. Its OpenID configuration comes from oauth_metadata.
+    oauth_clients = {}
+
+    def auth0_client():
+        if "auth0" not in oauth_clients:
+            from authlib.integrations.flask_client import OAuth
+            oauth = OAuth(app)
+            oauth.register(
+                "auth0",
+                client_id=env.get("AUTH0_CLIENT_ID"),
+                client_secret=env.get("AUTH0_CLIENT_SECRET"),
+                client_kwargs={
+                    "scope": "openid profile email",
+                },
+                server_metadata_url=oauth_metadata.url
+            )
+            oauth_metadata.apply(oauth.auth0)
+            oauth_clients["auth0"] = oauth.auth0
+        return oauth_clients["auth0"]
 
     @app.route("/login")
     def login():
-        return oauth.auth0.authorize_redirect(
+        return auth0_client().authorize_redirect(
             redirect_uri=url_for("callback", _external=True, _scheme='https')
         )
 
     @app.route("/callback", methods=["GET", "POST"])
     def callback():
-        token = oauth.auth0.authorize_access_token()
-        session["user"] = token
-        print(token)
+        token = auth0_client().authorize_access_token()
+        # New session id at login, not available with the cookie session (SESSION_BACKEND=cookie)
+        if hasattr(session, "regenerate"):
+            session.regenerate()
+        # Only the userinfo claims, not the complete token response
+        session["user"] = session_user(token)
         return redirect("/")
 
     @app.route("/logout")
@@ -86,15 +141,180 @@ def create_app(test_config=None):
         )
         
 
+    # Logged in user for the HTML views, only serialized for display when there is one
+    def user_context():
+        user = session.get('user')
+        return {"session": user, "pretty": json.dumps(user, indent=4) if user else None}
+
+    # Page of records for the HTML views, an invalid cursor falls back to the first page
+    def render_page(query_page, prefix=""):
+        try:
+            after, limit = page_args(prefix)
+        except ValueError:
+            after, limit = None, PAGE_SIZE
+        records, next_after = query_page(after, limit)
+        return records, encode_cursor(next_after)
+
     # Homepage
     @app.route('/')
     #@requires_auth('read:actors')
+    @read_only
     def index():
-        movies = Movie.query.all()
-        actors = Actor.query.all()
-        return render_template('index.html', movies=movies, actors=actors, session=session.get('user'), pretty=json.dumps(session.get('user'), indent=4))
+        movies, movies_next = render_page(queryMoviePage, "movies_")
+        actors, actors_next = render_page(queryActorPage, "actors_")
+        return render_template('index.html', movies=movies, actors=actors, movies_next=movies_next, actors_next=actors_next, **user_context())
 
 
+    #----------------------------------------------------------------------------#
+    # Bulk helpers
+    #----------------------------------------------------------------------------#
+
+    # Reads the JSON array of a bulk request, returns (items, None) or (None, error response)
+    def bulk_items():
+        items = request.get_json(silent=True)
+        if not isinstance(items, list) or not items:
+            return None, (jsonify({"success": False, "error": "Request body must be a non-empty JSON array."}), 400)
+        if len(items) > BULK_MAX_ITEMS:
+            return None, (jsonify({"success": False, "error": f"A bulk request accepts at most {BULK_MAX_ITEMS} items."}), 413)
+        return items, None
+
+    # Reads the JSON array of ids of a bulk delete, returns (ids, None) or (None, error response)
+    def bulk_ids():
+        items, error = bulk_items()
+        if error:
+            return None, error
+        if not all(isinstance(item, int) and not isinstance(item, bool) for item in items):
+            return None, (jsonify({"success": False, "error": "Request body must be a JSON array of ids."}), 400)
+        return list(dict.fromkeys(items)), None
+
+    # Large bulk requests, or ones sent with "Prefer: respond-async", run as a background job
+    def run_as_job(items):
+        return len(items) > JOB_INLINE_MAX_ITEMS or 'respond-async' in request.headers.get('Prefer', '')
+
+    # Queues the job, 202 with its status and a Location to poll
+    def job_response(kind, items):
+        try:
+            job = enqueue(kind, items)
+        except SQLAlchemyError as err_job:
+            db.session.rollback()
+            logger.error("Queueing a %s job failed: %s", kind, err_job)
+            return jsonify({"success": False, "error": "Database error"}), 500
+        response = jsonify({"success": True, "job": job_status(job)})
+        response.status_code = 202
+        response.headers["Location"] = url_for("show_job", job_id=job.job_id)
+        db.session.close()
+        return response
+
+    # Streams the request body into the database, see ingest.py.
+    # Query parameters: format (ndjson or csv) and skip (records to pass over when resuming).
+    def import_upload(kind):
+        fmt = request.args.get('format')
+        if fmt is None:
+            fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        if fmt not in FORMATS:
+            return jsonify({"success": False, "error": "Format must be ndjson or csv."}), 400
+        skip = request.args.get('skip', 0, type=int)
+
+        lines = (line.decode('utf-8') for line in request.stream)
+        try:
+            stats = ingest(lines, fmt, kind, skip=skip)
+        except IngestError as err_import:
+            # The chunks committed before the failure stay imported
+            if kind == 'casts':
+                response_cache.clear()
+                costar_graph.reset()
+            logger.error("Import of %s failed: %s", kind, err_import)
+            return jsonify({"success": False, "error": err_import.error,
+                            "import": err_import.stats.to_dict()}), err_import.status_code
+        if kind == 'casts':
+            response_cache.clear()
+            costar_graph.reset()
+        return jsonify({"success": True, "import": stats.to_dict()}), 201 if stats.inserted else 200
+
+    # Streams a whole table as NDJSON or CSV, see export.py.
+    # Query parameter: format (ndjson or csv, default ndjson).
+    def export_download(kind):
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"success": False, "error": "Format must be ndjson or csv."}), 400
+        return Response(
+            stream_with_context(export_rows(kind, fmt)),
+            mimetype=EXPORT_FORMATS[fmt],
+            headers={"Content-Disposition": f"attachment; filename={kind}.{fmt}"}
+        )
+
+    # The q (prefix) and limit parameters of a search. Raises ValueError on invalid values.
+    def search_args():
+        prefix = request.args.get('q', '').strip()
+        if not prefix or len(prefix) > 100:
+            raise ValueError("Query parameter q must have 1 to 100 characters")
+        limit = request.args.get('limit', SEARCH_LIMIT, type=int)
+        if limit is None or limit < 1:
+            raise ValueError("Invalid limit")
+        return prefix, min(limit, SEARCH_MAX_LIMIT)
+
+    # Fieldset of the ?fields= parameter, returns (fields, None) or (None, error response)
+    def sparse_fields(serializer):
+        try:
+            return serializer.parse_fields(request.args.get('fields')), None
+        except ValueError as err_fields:
+            return None, (jsonify({"success": False, "error": str(err_fields)}), 400)
+
+    # Casts of many movies in one query, grouped by movie in the requested order.
+    # At most a page of movies (MAX_PAGE_SIZE) per request.
+    def cast_batch(mov_ids):
+        fields, error = sparse_fields(cast_member_serializer)
+        if error:
+            return error
+        if not mov_ids:
+            return jsonify({"success": False, "error": "Provide at least one movie id."}), 400
+        mov_ids = list(dict.fromkeys(mov_ids))
+        if len(mov_ids) > MAX_PAGE_SIZE:
+            return jsonify({"success": False, "error": f"A batch accepts at most {MAX_PAGE_SIZE} movie ids."}), 413
+
+        try:
+            casts = queryCastByMovies(mov_ids)
+        except SQLAlchemyError as err_cas_batch:
+            db.session.rollback()
+            logger.error("Batch cast lookup failed: %s", err_cas_batch)
+            return jsonify({"success": False, "error": "Database error"}), 500
+        finally:
+            db.session.close()
+
+        movies = [
+            {"mov_id": mov_id, "cast_list": cast_member_serializer.pick(casts[mov_id], fields)}
+            for mov_id in mov_ids
+            if mov_id in casts
+        ]
+        not_found = [mov_id for mov_id in mov_ids if mov_id not in casts]
+        return jsonify({"success": True, "movies": movies, "not_found": not_found})
+
+    # ETag of a versioned resource in the requested fieldset. The fieldset is
+    # normalized to the serializer's field order, the full body has none.
+    def fields_etag(tag, serializer, fields):
+        if fields == serializer.fields:
+            return tag
+        return tag + ";fields=" + ",".join(name for name in serializer.fields if name in fields)
+
+    # Conditional GET: a 304 response when the client already has the current
+    # version (If-None-Match), otherwise None
+    def not_modified(etag):
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        return None
+
+    def bulk_response(results):
+        created = sum(1 for result in results if result["success"])
+        body = {
+            "success": True,
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        }
+        return jsonify(body), 201 if created else 200
+
     #----------------------------------------------------------------------------#
     # Movies
     #----------------------------------------------------------------------------#
@@ -106,15 +326,11 @@ def create_app(test_config=None):
         body = {}
         try:
             data = request.get_json()
-            print("Received JSON data:", data)
+            logger.debug("Received JSON data: %s", data)
             mov_title = data.get('mov_title')
             mov_release = data.get('mov_release')
             mov_language = data.get('mov_language')
 
-            print("Title = ", mov_title)
-            print("Release = ", mov_release)
-            print("Language = ", mov_language)
-
             if not mov_title or not mov_release:
                 return jsonify({"error": "Mandatory value for either movie title or release year is missing."}), 400
 
@@ -122,41 +338,133 @@ def create_app(test_config=None):
             db.session.add(movie)
             db.session.commit()
 
-            body = {
-                'mov_title': movie.mov_title,
-                'mov_release': movie.mov_release,
-                'mov_language': movie.mov_language
-            }
-            return jsonify({"success": True, "mov_title": movie.mov_title, "data": body}), 201
+            body = movie_serializer.dump(movie)
+            return jsonify({"success": True, "mov_title": body['mov_title'], "data": body}), 201
 
         except Exception as err_mov_crt:
             db.session.rollback()
-            print(str(err_mov_crt))
+            logger.error("Failed to create movie: %s", err_mov_crt)
             return jsonify({"error": "Invalid request data in Movies"}), 400
 
         finally:
             db.session.close()
 
+    # Endpoint to add many movies in one transaction
+    @app.route('/movies/bulk', methods=['POST'])
+    @requires_auth('post:movie')
+    def create_movies_bulk(payload):
+        items, error = bulk_items()
+        if error:
+            return error
+
+        if run_as_job(items):
+            return job_response('create_movies', items)
+
+        try:
+            results = create_movies(items)
+            db.session.commit()
+            return bulk_response(results)
+
+        except SQLAlchemyError as err_mov_bulk:
+            db.session.rollback()
+            logger.error("Bulk movie insert failed: %s", err_mov_bulk)
+            return jsonify({"success": False, "error": "Database error"}), 500
+
+        finally:
+            db.session.close()
+
+    # Endpoint to delete many movies, with their cast entries, in one transaction
+    @app.route('/movies/bulk', methods=['DELETE'])
+    @requires_auth('delete:movie')
+    def delete_movies_bulk(payload):
+        mov_ids, error = bulk_ids()
+        if error:
+            return error
+        if run_as_job(mov_ids):
+            return job_response('delete_movies', mov_ids)
+
+        try:
+            deleted, act_ids = delete_movies(mov_ids)
+            touchVersions(actor_ids=act_ids)
+            db.session.commit()
+            response_cache.invalidate(movie_ids=deleted, actor_ids=act_ids)
+            costar_graph.casts_changed(movie_ids=deleted, actor_ids=act_ids)
+            not_found = [mov_id for mov_id in mov_ids if mov_id not in deleted]
+            return jsonify({"success": True, "deleted": len(deleted), "not_found": not_found})
+
+        except SQLAlchemyError as err_mov_bulk_del:
+            db.session.rollback()
+            logger.error("Bulk movie delete failed: %s", err_mov_bulk_del)
+            return jsonify({"success": False, "error": "Database error"}), 500
+
+        finally:
+            db.session.close()
+
+    # Endpoint to stream a large NDJSON or CSV file of movies into the database
+    @app.route('/movies/import', methods=['POST'])
+    @requires_auth('post:movie')
+    def import_movies(payload):
+        return import_upload('movies')
+
+    # Endpoint to stream all movies out as NDJSON or CSV
+    @app.route('/movies/export', methods=['GET'])
+    @requires_auth('read:movies')
+    @read_only
+    def export_movies(payload):
+        return export_download('movies')
+
+    # Endpoint to list movies, one page at a time
+    @app.route('/movies', methods=['GET'])
+    @requires_auth('read:movies')
+    @read_only
+    def list_movies(payload):
+        try:
+            after, limit = page_args()
+        except ValueError as err_page:
+            return jsonify({"success": False, "error": str(err_page)}), 400
+        fields, error = sparse_fields(movie_serializer)
+        if error:
+            return error
+
+        movies, next_after = queryMoviePage(after, limit)
+        movie_list = movie_serializer.dump_many(movies, fields)
+        return jsonify({"success": True, "movies": movie_list, "next_cursor": encode_cursor(next_after)})
+
+    # Endpoint to search movies by the start of their title (autocomplete)
+    @app.route('/search/movies', methods=['GET'])
+    @requires_auth('read:movies')
+    @read_only
+    def search_movies(payload):
+        try:
+            prefix, limit = search_args()
+        except ValueError as err_search:
+            return jsonify({"success": False, "error": str(err_search)}), 400
+        fields, error = sparse_fields(movie_serializer)
+        if error:
+            return error
+
+        movies = querySearchMovies(prefix, limit)
+        return jsonify({"success": True, "movies": movie_serializer.dump_many(movies, fields)})
+
     # Endpoint to delete movies
     @app.route('/movies/<int:mov_id>', methods=['DELETE'])
     @requires_auth('delete:movie')
     def delete_movie(payload, mov_id):
         try:
-            movie = Movie.query.get(mov_id)
-
-            if movie:
-                # Delete associated cast entries
-                Cast.query.filter_by(mov_id=mov_id).delete()
+            # One DELETE, the database removes the cast entries (ON DELETE CASCADE)
+            deleted, act_ids = delete_movies([mov_id])
 
-                # Now, delete the movie
-                db.session.delete(movie)
+            if deleted:
+                touchVersions(actor_ids=act_ids)
                 db.session.commit()
+                response_cache.invalidate(movie_ids=[mov_id], actor_ids=act_ids)
+                costar_graph.casts_changed(movie_ids=[mov_id], actor_ids=act_ids)
                 return jsonify({'success': True})
             else:
                 return jsonify({'success': False, 'error': 'Movie not found in database'}), 404
         except SQLAlchemyError as err_mov_del:
             db.session.rollback()
-            print(str(err_mov_del))
+            logger.error("Failed to delete movie %s: %s", mov_id, err_mov_del)
             return jsonify({"success": False, "error": "Database error"}), 500
         finally:
             db.session.close()
@@ -174,14 +482,18 @@ def create_app(test_config=None):
             if movie:
                 # Update the movie title
                 movie.mov_title = new_title
+                act_ids = queryActorIdsByMovie(mov_id)
+                # The title is part of the portfolios of the cast
+                touchVersions(movie_ids=[mov_id], actor_ids=act_ids)
                 db.session.commit()
+                response_cache.invalidate(movie_ids=[mov_id], actor_ids=act_ids)
                 return jsonify({"success": True})
             else:
                 return jsonify({"success": False, "error": "Movie not found"})
 
         except SQLAlchemyError as err_mov_titl:
             db.session.rollback()
-            print(str(err_mov_titl))
+            logger.error("Failed to rename movie %s: %s", mov_id, err_mov_titl)
             return jsonify({"success": False, "error": "Database error"})
 
         finally:
@@ -211,36 +523,144 @@ def create_app(test_config=None):
             db.session.add(actor)
             db.session.commit()
 
-            body = {
-                'act_firstname': actor.act_firstname,
-                'act_lastname': actor.act_lastname,
-                'act_language': actor.act_language,
-                'act_gender': actor.act_gender
-            }
-            return jsonify({"success": True, "act_firstname": actor.act_firstname, "data": body}), 201
+            body = actor_serializer.dump(actor)
+            return jsonify({"success": True, "act_firstname": body['act_firstname'], "data": body}), 201
 
         except Exception as err_act_crt:
             db.session.rollback()
-            print(str(err_act_crt))
+            logger.error("Failed to create actor: %s", err_act_crt)
             return jsonify({"error": "Invalid request data in Actors"}), 400
 
         finally:
             db.session.close()
 
+    # Endpoint to add many actors in one transaction
+    @app.route('/actors/bulk', methods=['POST'])
+    @requires_auth('post:actor')
+    def create_actors_bulk(payload):
+        items, error = bulk_items()
+        if error:
+            return error
+
+        if run_as_job(items):
+            return job_response('create_actors', items)
+
+        try:
+            results = create_actors(items)
+            db.session.commit()
+            return bulk_response(results)
+
+        except SQLAlchemyError as err_act_bulk:
+            db.session.rollback()
+            logger.error("Bulk actor insert failed: %s", err_act_bulk)
+            return jsonify({"success": False, "error": "Database error"}), 500
+
+        finally:
+            db.session.close()
+
+    # Endpoint to delete many actors, with their cast entries, in one transaction
+    @app.route('/actors/bulk', methods=['DELETE'])
+    @requires_auth('delete:actor')
+    def delete_actors_bulk(payload):
+        act_ids, error = bulk_ids()
+        if error:
+            return error
+        if run_as_job(act_ids):
+            return job_response('delete_actors', act_ids)
+
+        try:
+            deleted, mov_ids = delete_actors(act_ids)
+            touchVersions(movie_ids=mov_ids)
+            db.session.commit()
+            response_cache.invalidate(movie_ids=mov_ids, actor_ids=deleted)
+            costar_graph.casts_changed(movie_ids=mov_ids, actor_ids=deleted)
+            not_found = [act_id for act_id in act_ids if act_id not in deleted]
+            return jsonify({"success": True, "deleted": len(deleted), "not_found": not_found})
+
+        except SQLAlchemyError as err_act_bulk_del:
+            db.session.rollback()
+            logger.error("Bulk actor delete failed: %s", err_act_bulk_del)
+            return jsonify({"success": False, "error": "Database error"}), 500
+
+        finally:
+            db.session.close()
+
+    # Endpoint to stream a large NDJSON or CSV file of actors into the database
+    @app.route('/actors/import', methods=['POST'])
+    @requires_auth('post:actor')
+    def import_actors(payload):
+        return import_upload('actors')
+
+    # Endpoint to stream all actors out as NDJSON or CSV
+    @app.route('/actors/export', methods=['GET'])
+    @requires_auth('read:actors')
+    @read_only
+    def export_actors(payload):
+        return export_download('actors')
+
+    # Endpoint to list actors, one page at a time
+    @app.route('/actors', methods=['GET'])
+    @requires_auth('read:actors')
+    @read_only
+    def list_actors(payload):
+        try:
+            after, limit = page_args()
+        except ValueError as err_page:
+            return jsonify({"success": False, "error": str(err_page)}), 400
+        fields, error = sparse_fields(actor_serializer)
+        if error:
+            return error
+
+        actors, next_after = queryActorPage(after, limit)
+        actor_list = actor_serializer.dump_many(actors, fields)
+        return jsonify({"success": True, "actors": actor_list, "next_cursor": encode_cursor(next_after)})
+
+    # Endpoint to search actors by the start of their full, first or last name (autocomplete)
+    @app.route('/search/actors', methods=['GET'])
+    @requires_auth('read:actors')
+    @read_only
+    def search_actors(payload):
+        try:
+            prefix, limit = search_args()
+        except ValueError as err_search:
+            return jsonify({"success": False, "error": str(err_search)}), 400
+        fields, error = sparse_fields(actor_serializer)
+        if error:
+            return error
+
+        actors = querySearchActors(prefix, limit)
+        return jsonify({"success": True, "actors": actor_serializer.dump_many(actors, fields)})
+
     # Endpoint to get actors
     @app.route('/actor', methods=['GET'])
     @requires_auth('read:actors')
+    @read_only
     def show_actor(payload):
-        actors = Actor.query.all()
-        return render_template('portfolio.html', actors=actors, session=session.get('user'), pretty=json.dumps(session.get('user'), indent=4))
+        actors, actors_next = render_page(queryActorPage)
+        return render_template('portfolio.html', actors=actors, actors_next=actors_next, **user_context())
 
     @app.route('/actor/<int:act_id>/movies')
+    @read_only
     def get_actor_portfolio(act_id):
+        fields, error = sparse_fields(portfolio_serializer)
+        if error:
+            return error
 
-        movies = queryMovieByActor(act_id)
+        version = queryActorVersion(act_id)
+        etag = fields_etag(f"actor-{act_id}-{version}", portfolio_serializer, fields)
+        if version is not None:
+            # The client already has the current portfolio, skip building the response
+            cached_response = not_modified(etag)
+            if cached_response:
+                return cached_response
+
+        movies = response_cache.get_or_load(
+            response_cache.actor_portfolio_key(act_id), lambda: queryPortfolioByActor(act_id), version)
 
         if movies is not None:
-            return jsonify(success=True, cast_list=movies)
+            response = jsonify(success=True, cast_list=portfolio_serializer.pick(movies, fields))
+            response.set_etag(etag)
+            return response
         else:
             return jsonify(success=False, message='Failed to retrieve movies')
 
@@ -249,17 +669,20 @@ def create_app(test_config=None):
     @requires_auth('delete:actor')
     def delete_actor(payload, act_id):
         try:
-            actor = Actor.query.get(act_id)
+            # One DELETE, the database removes the cast entries (ON DELETE CASCADE)
+            deleted, mov_ids = delete_actors([act_id])
 
-            if actor:
-                db.session.delete(actor)
+            if deleted:
+                touchVersions(movie_ids=mov_ids)
                 db.session.commit()
+                response_cache.invalidate(movie_ids=mov_ids, actor_ids=[act_id])
+                costar_graph.casts_changed(movie_ids=mov_ids, actor_ids=[act_id])
                 return jsonify({'success': True})
             else:
                 return jsonify({'success': False, 'error': 'Actor not found'}), 404
         except SQLAlchemyError as err_act_del:
             db.session.rollback()
-            print(str(err_act_del))
+            logger.error("Failed to delete actor %s: %s", act_id, err_act_del)
             return jsonify({"success": False, "error": "Database error"}), 500
         finally:
             db.session.close()
@@ -274,17 +697,17 @@ def create_app(test_config=None):
     '''
     @app.route('/cast', methods=['GET'])
     @requires_auth('read:cast')
+    @read_only
     def show_cast(payload):
 
-        movies = Movie.query.all()
-        return render_template('cast.html', movies=movies, session=session.get('user'), pretty=json.dumps(session.get('user'), indent=4))
+        movies, movies_next = render_page(queryMoviePage)
+        return render_template('cast.html', movies=movies, movies_next=movies_next, **user_context())
 
     # Endpoint to assign actors to movie casts.
     @app.route('/movie/<int:mov_id>/cast/add/<int:act_id>', methods=['POST'])
     @requires_auth('post:actor-cast')
     def add_actor_to_cast(mov_id, act_id, cas_role):
         try:
-            #print(f"Received mov_id: {mov_id}, act_id: {act_id}, cas_role: {cas_role}")
             movie = Movie.query.get(mov_id)
             actor = Actor.query.get(act_id)
             role = Cast.query.get(cas_role)
@@ -297,13 +720,16 @@ def create_app(test_config=None):
 
                 cast = Cast(movie=movie, actor=actor, role=role)
                 db.session.add(cast)
+                touchVersions(movie_ids=[mov_id], actor_ids=[act_id])
                 db.session.commit()
+                response_cache.invalidate(movie_ids=[mov_id], actor_ids=[act_id])
+                costar_graph.casts_changed(movie_ids=[mov_id], actor_ids=[act_id])
                 return jsonify({'success': True})
             else:
                 return jsonify({'success': False, 'error': 'Movie or actor not found'}), 404
         except SQLAlchemyError as error_assing_act:
             db.session.rollback()
-            print(str(error_assing_act))
+            logger.error("Failed to add actor %s to cast of movie %s: %s", act_id, mov_id, error_assing_act)
             return jsonify({"success": False, "error": "Database error"}), 500
         finally:
             db.session.close()
@@ -313,39 +739,44 @@ def create_app(test_config=None):
     # Endpoint to retrieve movie cast in data dictionairy format.
     @app.route('/movie/<int:mov_id>/cast', methods=['GET'])
     @requires_auth('read:cast')
+    @read_only
     def get_movie_cast(payload, mov_id):
+        fields, error = sparse_fields(cast_member_serializer)
+        if error:
+            return error
+
         try:
-            movie = Movie.query.get(mov_id)
+            version = queryMovieVersion(mov_id)
 
             # Check if the movie exists
-            if not movie:
+            if version is None:
                 return jsonify({'success': False, 'error': 'Movie not found'}), 404
 
-            cast_list = []
-
-            for cast_entry in movie.casts:
-                cast_dict = {
-                    "act_id": cast_entry.actor.act_id,
-                    "act_firstname": cast_entry.actor.act_firstname,
-                    "act_lastname": cast_entry.actor.act_lastname,
-                }
+            # The client already has the current cast, skip building the response
+            etag = fields_etag(f"movie-{mov_id}-{version}", cast_member_serializer, fields)
+            cached_response = not_modified(etag)
+            if cached_response:
+                return cached_response
 
-                if cast_entry.cas_role is not None:  # Access cas_role directly from cast_entry
-                    cast_dict["cas_role"] = cast_entry.cas_role
+            cast_list = response_cache.get_or_load(
+                response_cache.movie_cast_key(mov_id), lambda: queryCastByMovie(mov_id), version)
 
-                cast_list.append(cast_dict)
+            if cast_list is None:
+                return jsonify({'success': False, 'error': 'Movie not found'}), 404
 
-            return jsonify({'success': True, 'cast_list': cast_list})
+            response = jsonify({'success': True, 'cast_list': cast_member_serializer.pick(cast_list, fields)})
+            response.set_etag(etag)
+            return response
 
         except SQLAlchemyError as err_mov_cast:
             # Handle database errors
             db.session.rollback()
-            print(str(err_mov_cast))
+            logger.error("Failed to retrieve cast of movie %s: %s", mov_id, err_mov_cast)
             return jsonify({"success": False, "error": "Database error"}), 500
 
         except Exception as e:
             # Handle other exceptions
-            print("An error occurred:", str(e))
+            logger.exception("An error occurred: %s", e)
             return jsonify({'success': False, 'error': str(e)})
 
 
@@ -353,18 +784,137 @@ def create_app(test_config=None):
         finally:
             db.session.close()
 
+    # Endpoint to retrieve the casts of many movies at once,
+    # e.g. /casts?mov_id=1,2,3 (or ?mov_id=1&mov_id=2)
+    @app.route('/casts', methods=['GET'])
+    @requires_auth('read:cast')
+    @read_only
+    def get_casts(payload):
+        try:
+            mov_ids = [
+                int(mov_id)
+                for value in request.args.getlist('mov_id')
+                for mov_id in value.split(',') if mov_id.strip()
+            ]
+        except ValueError:
+            return jsonify({"success": False, "error": "mov_id must be a comma separated list of integers."}), 400
+        return cast_batch(mov_ids)
+
+    # Endpoint to retrieve the casts of many movies at once, body: {"mov_ids": [1, 2, 3]}
+    @app.route('/casts/batch', methods=['POST'])
+    @requires_auth('read:cast')
+    @read_only
+    def get_casts_batch(payload):
+        data = request.get_json(silent=True)
+        mov_ids = data.get('mov_ids') if isinstance(data, dict) else None
+        if not isinstance(mov_ids, list) or not all(type(mov_id) is int for mov_id in mov_ids):
+            return jsonify({"success": False, "error": "Body must be a JSON object with a mov_ids array of integers."}), 400
+        return cast_batch(mov_ids)
+
     # Endpoint to get cast/movie portofolio for actor
     @app.route('/actor/<int:act_id>/casts', methods=['GET'])
     @requires_auth('read:actor_portfolio')
+    @read_only
     def get_actor_casts(payload, act_id):
+        fields, error = sparse_fields(portfolio_serializer)
+        if error:
+            return error
 
-        casts = queryCastByActor(act_id)
+        version = queryActorVersion(act_id)
+        etag = fields_etag(f"actor-{act_id}-{version}", portfolio_serializer, fields)
+        if version is not None:
+            # The client already has the current portfolio, skip building the response
+            cached_response = not_modified(etag)
+            if cached_response:
+                return cached_response
+
+        casts = response_cache.get_or_load(
+            response_cache.actor_portfolio_key(act_id), lambda: queryPortfolioByActor(act_id), version)
 
         if casts is not None:
-            return jsonify(success=True, cast_list=casts)
+            response = jsonify(success=True, cast_list=portfolio_serializer.pick(casts, fields))
+            response.set_etag(etag)
+            return response
         else:
             return jsonify(success=False, message='Failed to retrieve movies')
 
+    # Endpoint to get the co-stars of an actor: the actors who appeared in a
+    # movie with them, most shared movies first. Served by the co-star graph.
+    @app.route('/actor/<int:act_id>/costars', methods=['GET'])
+    @requires_auth('read:actor_portfolio')
+    @read_only
+    def get_actor_costars(payload, act_id):
+        limit = request.args.get('limit', COSTAR_LIMIT, type=int)
+        if limit is None or limit < 1:
+            return jsonify({"success": False, "error": "Invalid limit"}), 400
+        fields, error = sparse_fields(actor_serializer)
+        if error:
+            return error
+
+        try:
+            if db.session.get(Actor, act_id) is None:
+                return jsonify({'success': False, 'error': 'Actor not found'}), 404
+            costars = costar_graph.costars(act_id, min(limit, MAX_PAGE_SIZE))
+            actors = queryActorsByIds([costar for costar, shared in costars])
+        except GraphUnavailable as err_graph:
+            return jsonify({"success": False, "error": str(err_graph)}), 503
+        except SQLAlchemyError as err_costars:
+            db.session.rollback()
+            logger.error("Co-star lookup of actor %s failed: %s", act_id, err_costars)
+            return jsonify({"success": False, "error": "Database error"}), 500
+        finally:
+            db.session.close()
+
+        costar_list = [
+            dict(actor_serializer.dump(actors[costar], fields), shared_movies=shared)
+            for costar, shared in costars
+            if costar in actors
+        ]
+        return jsonify({"success": True, "act_id": act_id, "costars": costar_list})
+
+    # Endpoint to get the shortest chain of collaborations between two actors
+    # ("degrees of separation"): movies[i] links actors[i] and actors[i + 1].
+    # Query parameters: from, to (act_ids) and max_depth (movies, at most COSTAR_MAX_DEPTH).
+    @app.route('/actors/path', methods=['GET'])
+    @requires_auth('read:actor_portfolio')
+    @read_only
+    def get_actors_path(payload):
+        source = request.args.get('from', type=int)
+        target = request.args.get('to', type=int)
+        max_depth = request.args.get('max_depth', COSTAR_MAX_DEPTH, type=int)
+        if source is None or target is None:
+            return jsonify({"success": False, "error": "Query parameters from and to must be actor ids."}), 400
+        if max_depth is None or max_depth < 1:
+            return jsonify({"success": False, "error": "Invalid max_depth"}), 400
+
+        try:
+            if len(queryActorsByIds([source, target])) < len({source, target}):
+                return jsonify({'success': False, 'error': 'Actor not found'}), 404
+            path = costar_graph.path(source, target, min(max_depth, COSTAR_MAX_DEPTH))
+            if path is None:
+                return jsonify({'success': False, 'error': 'No connection found'}), 404
+            act_ids, mov_ids = path
+            actors = queryActorsByIds(act_ids)
+            movies = queryMoviesByIds(mov_ids)
+        except GraphUnavailable as err_graph:
+            return jsonify({"success": False, "error": str(err_graph)}), 503
+        except SQLAlchemyError as err_path:
+            db.session.rollback()
+            logger.error("Path from actor %s to %s failed: %s", source, target, err_path)
+            return jsonify({"success": False, "error": "Database error"}), 500
+        finally:
+            db.session.close()
+
+        if len(actors) < len(set(act_ids)) or len(movies) < len(set(mov_ids)):
+            # Deleted by another process since the graph was built
+            return jsonify({'success': False, 'error': 'No connection found'}), 404
+        return jsonify({
+            "success": True,
+            "degrees": len(mov_ids),
+            "actors": [actor_serializer.dump(actors[act_id]) for act_id in act_ids],
+            "movies": [movie_serializer.dump(movies[mov_id]) for mov_id in mov_ids]
+        })
+
     # Endpoint to remove actor from a cast
     @app.route('/movie/<int:mov_id>/cast/delete/<int:act_id>', methods=['POST'])
     @requires_auth('delete:actor')
@@ -379,7 +929,10 @@ def create_app(test_config=None):
 
                 if cast_entry:
                     db.session.delete(cast_entry)
+                    touchVersions(movie_ids=[mov_id], actor_ids=[act_id])
                     db.session.commit()
+                    response_cache.invalidate(movie_ids=[mov_id], actor_ids=[act_id])
+                    costar_graph.casts_changed(movie_ids=[mov_id], actor_ids=[act_id])
                     return jsonify({'success': True, 'message': 'Actor removed from the cast list'}), 200
                 else:
                     return jsonify({'success': False, 'message': 'Actor not found in the cast list'}), 404
@@ -387,7 +940,7 @@ def create_app(test_config=None):
                 return jsonify({'success': False, 'message': 'Movie or actor not found'}), 404
         except SQLAlchemyError as err_cas_act_del:
             db.session.rollback()
-            print(str(err_cas_act_del))
+            logger.error("Failed to remove actor %s from cast of movie %s: %s", act_id, mov_id, err_cas_act_del)
             return jsonify({'success': False, 'message': 'Failed to delete actor from the cast list'}), 500
         finally:
             db.session.close()
@@ -396,17 +949,13 @@ def create_app(test_config=None):
     @app.route('/cast/create', methods=['POST'])
     @requires_auth('post:cast')
     def create_cast(payload):
-        print("Received data:", request.data)
+        logger.debug("Received data: %s", request.data)
         try:
             data = request.get_json()
             mov_id = data.get('mov_id')
             act_id = data.get('act_id')
             cas_role = data.get('cas_role')
 
-            print("movie id  = ", mov_id)
-            print("actor_id = ", act_id)
-            print("cast id = ", cas_role)
-
             if not mov_id or not act_id or not cas_role:
                 return jsonify({"error": "Please provide all required information."}), 400
 
@@ -418,38 +967,132 @@ def create_app(test_config=None):
 
             cast = Cast(mov_id=mov_id, act_id=act_id, cas_role=cas_role)
             db.session.add(cast)
+            touchVersions(movie_ids=[mov_id], actor_ids=[act_id])
             db.session.commit()
+            response_cache.invalidate(movie_ids=[mov_id], actor_ids=[act_id])
+            costar_graph.casts_changed(movie_ids=[mov_id], actor_ids=[act_id])
 
             # Return the created cast data in the response
             response_body = {
                 "success": True,
-                "data": {
-                    "mov_id": cast.mov_id,
-                    "act_id": cast.act_id,
-                    "cas_role": cast.cas_role,
-                    # Add other relevant cast data fields here
-                }
+                "data": cast_serializer.dump(cast)
             }
             return jsonify(response_body), 201
 
         except IntegrityError as err_dt_integ:
             db.session.rollback()
-            print(str(err_dt_integ))
+            logger.error("Failed to create cast: %s", err_dt_integ)
             return jsonify({"error": "Failed to create cast due to database integrity error."}), 500
         
         except ValueError as value_err:
             db.session.rollback()
-            print(str(value_err))
+            logger.warning("Invalid cast data: %s", value_err)
             return jsonify({"error": "Invalid input data."}), 400
 
         except Exception as err_cas_crt:
             db.session.rollback()
-            print(str(err_cas_crt))
+            logger.error("Failed to create cast: %s", err_cas_crt)
             return jsonify({"error": "Failed to create cast."}), 500
 
         finally:
             db.session.close()
 
+    # Endpoint to add many casts in one transaction. Existing casts are skipped
+    # by the database (ON CONFLICT) instead of being looked up first.
+    @app.route('/casts/bulk', methods=['POST'])
+    @requires_auth('post:cast')
+    def create_casts_bulk(payload):
+        items, error = bulk_items()
+        if error:
+            return error
+
+        if run_as_job(items):
+            return job_response('create_casts', items)
+
+        try:
+            results, movie_ids, actor_ids = create_casts(items)
+            db.session.commit()
+            response_cache.invalidate(movie_ids=movie_ids, actor_ids=actor_ids)
+            costar_graph.casts_changed(movie_ids=movie_ids, actor_ids=actor_ids)
+            return bulk_response(results)
+
+        except SQLAlchemyError as err_cas_bulk:
+            db.session.rollback()
+            logger.error("Bulk cast insert failed: %s", err_cas_bulk)
+            return jsonify({"success": False, "error": "Database error"}), 500
+
+        finally:
+            db.session.close()
+
+    # Endpoint to stream a large NDJSON or CSV file of casts into the database
+    @app.route('/casts/import', methods=['POST'])
+    @requires_auth('post:cast')
+    def import_casts(payload):
+        return import_upload('casts')
+
+    # Endpoint to stream all casts out as NDJSON or CSV
+    @app.route('/casts/export', methods=['GET'])
+    @requires_auth('read:cast')
+    @read_only
+    def export_casts(payload):
+        return export_download('casts')
+
+    #----------------------------------------------------------------------------#
+    # Jobs
+    #----------------------------------------------------------------------------#
+
+    # Endpoint to follow a background job. Requires the permission of the
+    # operation the job runs (e.g. delete:movie for delete_movies).
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    @requires_auth(None)
+    def show_job(payload, job_id):
+        try:
+            job = db.session.get(Job, job_id)
+            if job is None:
+                return jsonify({'success': False, 'error': 'Job not found'}), 404
+            check_permissions(JOB_KINDS[job.job_kind].permission, payload)
+            return jsonify({"success": True, "job": job_status(job)})
+        except SQLAlchemyError as err_job:
+            db.session.rollback()
+            logger.error("Failed to read job %s: %s", job_id, err_job)
+            return jsonify({"success": False, "error": "Database error"}), 500
+        finally:
+            db.session.close()
+
+    # Endpoint to read the state of the database connection pool at runtime
+    @app.route('/status/pool', methods=['GET'])
+    @requires_metrics_access
+    def get_pool_status(payload):
+        replicas = {
+            key: dict(pool_status(db.engines[key]), healthy=healthy)
+            for key, healthy in replica_router.status(db.engines).items()
+        }
+        return jsonify({"success": True, "pool": pool_status(db.engine), "replicas": replicas})
+
+    # Endpoint to read the hit ratio of the response cache
+    @app.route('/status/cache', methods=['GET'])
+    @requires_metrics_access
+    def get_cache_status(payload):
+        return jsonify({"success": True, "cache": response_cache.stats()})
+
+    # Endpoint to read the size and hit counts of the verified token cache of this process
+    @app.route('/status/auth', methods=['GET'])
+    @requires_metrics_access
+    def get_auth_status(payload):
+        return jsonify({"success": True, "token_cache": token_cache.stats()})
+
+    # Endpoint to read the size and age of the co-star graph of this process
+    @app.route('/status/graph', methods=['GET'])
+    @requires_metrics_access
+    def get_graph_status(payload):
+        return jsonify({"success": True, "graph": costar_graph.status()})
+
+    # Endpoint for Prometheus to scrape the request metrics of this process
+    @app.route('/metrics', methods=['GET'])
+    @requires_metrics_access
+    def get_metrics(payload):
+        return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
     # Error handling for invalid requests
     @app.route('/NotValid', methods=['GET'])
     def not_valid():
@@ -1,17 +1,28 @@
 import json
+import logging
+import hmac
+import hashlib
+from collections import OrderedDict
 from os import environ as env
 from functools import wraps
 from datetime import datetime, timedelta
 from urllib.request import urlopen
 import os
+import tempfile
+import threading
+import time
 
-from jose import jwt
+from jose import jwt, jwk
 
 from flask import request
 
+from metrics import track
+
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Use auth0 for user authorization
 # AuthError Exception
 
@@ -73,12 +84,14 @@ def get_token_auth_header():
     return token
 
 
-def check_permissions(permission, payload):
+def check_permissions(permission, payload, token_scopes=None):
     """
-    Helper which checks if the decoded JWT has the required permission
+    Helper which checks if the decoded JWT has the required permission.
+    The precomputed permission set of a cached token can be passed as token_scopes.
     """
-    if payload.get('permissions'):
-        token_scopes = payload.get("permissions")
+    if token_scopes is None:
+        token_scopes = frozenset(payload.get('permissions') or ())
+    if token_scopes:
         if (permission not in token_scopes):
             raise AuthError(
                 {
@@ -95,14 +108,184 @@ def check_permissions(permission, payload):
             }, 401)
 
 
+## JWKS cache
+# The JWKS url can point to a local file (file:///path/to/jwks.json) or a stub
+# server, which makes it possible to verify tokens without reaching Auth0.
+JWKS_URL = env.get("JWKS_URL", f'https://{env.get("AUTH0_DOMAIN")}/.well-known/jwks.json')
+JWKS_CACHE_TTL = int(env.get("JWKS_CACHE_TTL", 3600))
+JWKS_MIN_REFRESH_INTERVAL = int(env.get("JWKS_MIN_REFRESH_INTERVAL", 30))
+
+
+class JWKSCache:
+    """
+    Process-wide cache of the signing keys published in the JWKS document.
+
+    Keys are parsed into RSA key objects once per fetch and are kept for `ttl`
+    seconds. A token signed with an unknown `kid` triggers a single refresh
+    (rotation), while the lock makes sure concurrent requests share that fetch.
+    """
+
+    def __init__(self, url=JWKS_URL, ttl=JWKS_CACHE_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        with urlopen(self.url) as jsonurl:
+            jwks = json.loads(jsonurl.read())
+
+        keys = {}
+        for key in jwks['keys']:
+            rsa_key = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use'),
+                'n': key['n'],
+                'e': key['e']
+            }
+            keys[key['kid']] = jwk.construct(rsa_key, key.get('alg', 'RS256'))
+        return keys
+
+    def refresh(self, seen_fetched_at=None):
+        """
+        Fetches the JWKS document unless another thread already refreshed
+        it since `seen_fetched_at`.
+        """
+        with self._lock:
+            if self._fetched_at is not None and self._fetched_at != seen_fetched_at:
+                return
+            try:
+                self._keys = self._fetch()
+            except Exception as err_jwks:
+                # Keep serving the previous key set if Auth0 is unreachable
+                if not self._keys:
+                    raise
+                logger.warning("Failed to refresh JWKS: %s", err_jwks)
+            self._fetched_at = time.monotonic()
+
+    def get_key(self, kid):
+        fetched_at = self._fetched_at
+        if fetched_at is None or time.monotonic() - fetched_at > self.ttl:
+            self.refresh(fetched_at)
+        elif kid not in self._keys and time.monotonic() - fetched_at > self.min_refresh_interval:
+            # Unknown kid, the signing keys have probably been rotated
+            self.refresh(fetched_at)
+        return self._keys.get(kid)
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+
+
+jwks_cache = JWKSCache()
+
+
+## OAuth metadata cache
+# The OpenID configuration of the Auth0 tenant is only needed for login. It is
+# resolved at the first login instead of at startup and kept in a local file,
+# so restarted processes don't fetch it again.
+OAUTH_METADATA_URL = env.get("OAUTH_METADATA_URL", f'https://{env.get("AUTH0_DOMAIN")}/.well-known/openid-configuration')
+# Per user by default, the temp directory is shared
+OAUTH_METADATA_CACHE = env.get("OAUTH_METADATA_CACHE", os.path.join(
+    tempfile.gettempdir(), f"casting_oauth_metadata-{os.getuid() if hasattr(os, 'getuid') else 'user'}.json"))
+OAUTH_METADATA_TTL = int(env.get("OAUTH_METADATA_TTL", 86400))
+
+
+class OAuthMetadataCache:
+    """
+    OpenID configuration, read from the local copy while it is younger than
+    `ttl` seconds and fetched (and stored) otherwise. A stale local copy is
+    still used when the fetch fails. A local copy that another user owns or
+    can write is ignored, it could point the login at other endpoints.
+    """
+
+    def __init__(self, url=OAUTH_METADATA_URL, path=OAUTH_METADATA_CACHE, ttl=OAUTH_METADATA_TTL):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self._metadata = None
+        self._lock = threading.Lock()
+
+    def _read(self, max_age=None):
+        try:
+            fd = os.open(self.path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+        except OSError:
+            return None
+        with os.fdopen(fd, encoding='utf-8') as file:
+            info = os.fstat(fd)
+            if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+                logger.warning("Ignoring OAuth metadata %s: not owned by this user or writable by others", self.path)
+                return None
+            if max_age is not None and time.time() - info.st_mtime > max_age:
+                return None
+            try:
+                return json.load(file)
+            except ValueError:
+                return None
+
+    def _fetch(self):
+        with urlopen(self.url) as jsonurl:
+            metadata = json.loads(jsonurl.read())
+        try:
+            # Write to a new temporary file (unpredictable name, mode 0600)
+            # first, so readers never see a partial copy
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.',
+                                            prefix=os.path.basename(self.path) + '.')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    json.dump(metadata, file)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError as err_metadata:
+            logger.warning("Failed to store OAuth metadata: %s", err_metadata)
+        return metadata
+
+    def get(self):
+        if self._metadata is None:
+            with self._lock:
+                if self._metadata is None:
+                    metadata = self._read(self.ttl)
+                    if metadata is None:
+                        try:
+                            metadata = self._fetch()
+                        except Exception as err_metadata:
+                            metadata = self._read()
+                            if metadata is None:
+                                raise
+                            logger.warning("Failed to refresh OAuth metadata: %s", err_metadata)
+                    self._metadata = metadata
+        return self._metadata
+
+    def apply(self, client):
+        """
+        Loads the metadata into an authlib client, so it doesn't fetch it itself
+        """
+        if '_loaded_at' not in client.server_metadata:
+            client.server_metadata.update(self.get(), _loaded_at=time.time())
+
+
+oauth_metadata = OAuthMetadataCache()
+
+
 def verify_decode_jwt(token):
     """
     Receives the encoded token and validates it after decoded
     """
-    jsonurl = urlopen(f'https://{env.get("AUTH0_DOMAIN")}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError as exc:
+        # Not a JWT at all, e.g. a wrong METRICS_TOKEN
+        raise AuthError(
+            {
+                'code': 'invalid_header',
+                'description': 'Authorization malformed.'
+            }, 401) from exc
     if 'kid' not in unverified_header:
         raise AuthError(
             {
@@ -110,15 +293,8 @@ def verify_decode_jwt(token):
                 'description': 'Authorization malformed.'
             }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    with track('jwks'):
+        rsa_key = jwks_cache.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(token,
@@ -155,19 +331,129 @@ def verify_decode_jwt(token):
         }, 400)
 
 
+## Verified token cache
+TOKEN_CACHE_SIZE = int(env.get("TOKEN_CACHE_SIZE", 1024))
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens, keyed by a hash of the token.
+
+    An entry holds the decoded payload and the frozenset of its permissions
+    and is evicted once the token expires, so repeated requests with the same
+    bearer token skip the signature verification.
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                # Token expired, let jwt.decode report it
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, token, payload):
+        permissions = frozenset(payload.get('permissions') or ())
+        exp = payload.get('exp')
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)):
+            return permissions
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (exp, payload, permissions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return permissions
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+token_cache = TokenCache()
+
+
+def verify_token(token):
+    """
+    Returns the decoded payload and permission set of the token, verifying
+    the signature only when the token is not in the cache yet
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    payload = verify_decode_jwt(token)
+    return payload, token_cache.put(token, payload)
+
+
+# With permission=None only the token is verified, the handler checks the
+# permissions itself (e.g. the permission that belongs to a job).
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            with track('auth'):
+                token = get_token_auth_header()
+                payload, token_scopes = verify_token(token)
+                if permission is not None:
+                    check_permissions(permission, payload, token_scopes)
             return f(payload, *args, **kwargs)
 
         return wrapper
 
     return requires_auth_decorator
 
+
+# The monitoring endpoints (/metrics, /status/*) need the read:metrics
+# permission, or this static bearer token for scrapers without Auth0 (e.g. Prometheus)
+METRICS_PERMISSION = "read:metrics"
+METRICS_TOKEN = env.get("METRICS_TOKEN")
+
+
+def requires_metrics_access(f):
+    """
+    requires_auth(METRICS_PERMISSION) that also accepts METRICS_TOKEN, the
+    handler gets no payload (None) then
+    """
+    authorized = requires_auth(METRICS_PERMISSION)(f)
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        token = get_token_auth_header()
+        if METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return f(None, *args, **kwargs)
+        return authorized(*args, **kwargs)
+
+    return wrapper
+
 # Function to generate a test JWT token
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 def generate_test_token():
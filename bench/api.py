@@ -0,0 +1,195 @@
+"""
+Benchmark of the API hot paths against a local database.
+
+Builds the app with create_app() against a local SQLite (default) or Postgres
+database seeded with synthetic data, signs tokens with a local RSA key (JWKS
+file instead of Auth0) and measures throughput and latency percentiles of the
+create, cast lookup, portfolio and delete endpoints. The results are compared
+with a stored baseline, a regression beyond the tolerance or a missing
+baseline fails the run (--no-baseline only reports the results).
+
+Usage (from the repository root):
+    python bench/api.py --movies 20000 --actors 100000 --casts 2000000 --save-baseline
+    python bench/api.py --movies 20000 --actors 100000 --casts 2000000
+    python bench/api.py --database-url postgresql://localhost/casting_bench
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixtures import LocalAuth, seed, seeded_counts, create_bench_app, create_delete_targets
+
+DEFAULT_DATABASE = "sqlite:///" + os.path.join(tempfile.gettempdir(), "casting_bench.db")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SCENARIOS = ("create_movie", "movie_cast", "cast_batch", "actor_portfolio", "delete_actor")
+
+
+def percentile(sorted_values, share):
+    # Nearest rank
+    index = max(0, min(len(sorted_values) - 1, int(round(share * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(values, 0.90) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+def run_scenario(client, requests, expected_status):
+    """
+    Sends the (method, path, json) requests one after the other, returns the summary
+    """
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for method, path, body in requests:
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code not in expected_status:
+            errors += 1
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the regressions of results against baseline, as messages
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            regressions.append(f"{name}: no baseline, store one with --save-baseline")
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {result[key]} > baseline {base[key]} (+{tolerance:.0%})")
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {result['rps']} < baseline {base['rps']} (-{tolerance:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE, help="database to seed and run against")
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--actors", type=int, default=10000)
+    parser.add_argument("--casts", type=int, default=200000)
+    parser.add_argument("--reseed", action="store_true", help="seed even if the database already has the requested counts")
+    parser.add_argument("--requests", type=int, default=1000, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed requests per scenario")
+    parser.add_argument("--batch-size", type=int, default=50, help="movies per cast_batch request")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on (off by default, to measure the database path)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="scenario to run (repeatable), all by default")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the requested ids")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression against the baseline")
+    parser.add_argument("--no-baseline", action="store_true", help="don't compare with the baseline, only report the results")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    # The app reads its settings from the environment at import time
+    auth = LocalAuth(tempfile.mkdtemp(prefix="casting_bench_"))
+    os.environ.update(auth.environ())
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "DATABASE_URL_TEST": args.database_url,
+        "CACHE_BACKEND": "memory" if args.cache else "none",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "SERVER_TIMING": "false",
+        # The co-star graph isn't benchmarked, don't build it in the background
+        "COSTAR_PRELOAD": "false",
+    })
+
+    from model import db
+
+    app = create_bench_app(args.database_url)
+    rng = random.Random(args.seed)
+    scenarios = args.scenario or SCENARIOS
+    total = args.warmup + args.requests
+
+    with app.app_context():
+        if args.reseed or seeded_counts(db) != (args.movies, args.actors, args.casts):
+            print(f"Seeding {args.movies} movies, {args.actors} actors, {args.casts} casts ...", file=sys.stderr)
+            started = time.perf_counter()
+            seed(db, args.movies, args.actors, args.casts)
+            print(f"Seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        if "delete_actor" in scenarios:
+            # Actors to delete, each with a few casts, created outside the measurement
+            delete_ids = create_delete_targets(db, total, args.movies, rng)
+        db.session.remove()
+
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = "Bearer " + auth.token()
+
+    def requests_for(name):
+        if name == "create_movie":
+            return [("POST", "/movie/create", {"mov_title": f"Bench {i}", "mov_release": 2000, "mov_language": "en"})
+                    for i in range(total)], (201,)
+        if name == "movie_cast":
+            return [("GET", f"/movie/{rng.randint(1, args.movies)}/cast", None) for _ in range(total)], (200,)
+        if name == "cast_batch":
+            return [("GET", "/casts?mov_id=" + ",".join(str(rng.randint(1, args.movies)) for _ in range(args.batch_size)), None)
+                    for _ in range(total)], (200,)
+        if name == "actor_portfolio":
+            return [("GET", f"/actor/{rng.randint(1, args.actors)}/casts", None) for _ in range(total)], (200,)
+        if name == "delete_actor":
+            return [("DELETE", f"/actor/{act_id}", None) for act_id in delete_ids], (200,)
+
+    results = {}
+    for name in scenarios:
+        requests, expected = requests_for(name)
+        run_scenario(client, requests[:args.warmup], expected)
+        results[name] = run_scenario(client, requests[args.warmup:], expected)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(f"{'scenario':<16}{'rps':>9}{'p50 ms':>10}{'p90 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, result in results.items():
+            print(f"{name:<16}{result['rps']:>9}{result['p50_ms']:>10}{result['p90_ms']:>10}"
+                  f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    failed = any(result["errors"] for result in results.values())
+    if args.no_baseline:
+        return 1 if failed else 0
+    if not os.path.exists(args.baseline):
+        # Without a baseline nothing is checked, that must not pass as a green run
+        print(f"No baseline at {args.baseline}: store one with --save-baseline, "
+              f"or pass --no-baseline to only report the results", file=sys.stderr)
+        return 1
+    with open(args.baseline, encoding="utf-8") as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    for message in regressions:
+        print("REGRESSION " + message, file=sys.stderr)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Fixtures for the benchmarks: a locally generated RSA key with a JWKS file
+standing in for Auth0, tokens signed with it, and synthetic seed data.
+"""
+import os
+import json
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+KEY_ID = "bench-key"
+ALL_PERMISSIONS = [
+    "delete:actor",
+    "delete:movie",
+    "post:actor",
+    "post:actor-cast",
+    "post:cast",
+    "post:movie",
+    "read:actor_portfolio",
+    "read:actors",
+    "read:cast",
+    "read:metrics",
+    "read:movies",
+    "update:movie"
+]
+
+
+class LocalAuth:
+    """
+    RSA key pair and JWKS document in place of the Auth0 tenant
+    """
+
+    def __init__(self, directory, domain="bench.local", audience="bench-api"):
+        self.domain = domain
+        self.audience = audience
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+        public_key = jwk.construct(public_pem, "RS256").to_dict()
+        public_key.update(kid=KEY_ID, use="sig", alg="RS256")
+        self.jwks_path = os.path.join(directory, "jwks.json")
+        with open(self.jwks_path, "w", encoding="utf-8") as file:
+            json.dump({"keys": [public_key]}, file)
+
+    def environ(self):
+        """
+        Environment variables that point the app at this key instead of Auth0
+        """
+        return {
+            "AUTH0_DOMAIN": self.domain,
+            "API_AUDIENCE": self.audience,
+            "ALGORITHMS": "RS256",
+            "JWKS_URL": "file://" + os.path.abspath(self.jwks_path),
+        }
+
+    def token(self, permissions=ALL_PERMISSIONS, expires_in=3600):
+        claims = {
+            "sub": "bench|user",
+            "iss": f"https://{self.domain}/",
+            "aud": self.audience,
+            "iat": int(time.time()),
+            "exp": int(time.time()) + expires_in,
+            "permissions": list(permissions),
+        }
+        return jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": KEY_ID})
+
+
+def seed(db, movies, actors, casts, batch_size=10000):
+    """
+    Replaces the tables of the primary database with synthetic data. Ids run
+    from 1 to the given counts, every cast gets a unique role.
+    """
+    from sqlalchemy import insert
+    from bulk import chunked
+    from model import Movie, Actor, Cast
+
+    db.drop_all(bind_key=None)
+    db.create_all(bind_key=None)
+
+    movie_rows = (
+        {"mov_title": f"Movie {i}", "mov_release": 1920 + i % 110, "mov_language": "en"}
+        for i in range(1, movies + 1)
+    )
+    actor_rows = (
+        {"act_firstname": f"First {i}", "act_lastname": f"Last {i}", "act_language": "en",
+         "act_gender": ("female", "male")[i % 2]}
+        for i in range(1, actors + 1)
+    )
+    # Spread the casts over all movies and (by a large odd stride) over all actors
+    cast_rows = (
+        {"mov_id": i % movies + 1, "act_id": (i * 7919) % actors + 1, "cas_role": f"Role {i}"}
+        for i in range(casts)
+    )
+    for table, rows in ((Movie.__table__, movie_rows), (Actor.__table__, actor_rows), (Cast.__table__, cast_rows)):
+        for chunk in chunked(rows, batch_size):
+            db.session.execute(insert(table), chunk)
+        db.session.commit()
+
+
+def seeded_counts(db):
+    """
+    Number of seeded movies, actors and casts in the primary database, None
+    without tables. Rows added by the benchmarks themselves are not counted.
+    """
+    from sqlalchemy import func, inspect, select
+    from model import Movie, Actor, Cast
+
+    if not inspect(db.engine).has_table(Cast.__tablename__):
+        return None
+    return tuple(
+        db.session.execute(select(func.count()).select_from(model).where(column.like(prefix))).scalar()
+        for model, column, prefix in (
+            (Movie, Movie.mov_title, "Movie %"), (Actor, Actor.act_lastname, "Last %"), (Cast, Cast.cas_role, "Role %"))
+    )
+
+
+def create_bench_app(database_url):
+    """
+    The app from create_app() with the testing settings, against database_url
+    and without read replicas. Call after the environment is set up.
+    """
+    from app import create_app
+    from config import TestingConfig, TESTING_POOL, engine_options
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(database_url, **TESTING_POOL)
+        SQLALCHEMY_BINDS = {}
+
+    return create_app(BenchConfig)
+
+
+def create_delete_targets(db, count, movies, rng, casts_per_actor=3):
+    """
+    Adds `count` actors, each with a few casts, to be deleted by a benchmark.
+    Returns their ids.
+    """
+    from sqlalchemy import insert, select, func
+    from model import Actor, Cast
+
+    first = (db.session.execute(select(func.max(Actor.act_id))).scalar() or 0) + 1
+    db.session.execute(insert(Actor.__table__), [
+        {"act_firstname": "Delete", "act_lastname": f"Me {first + i}"} for i in range(count)])
+    db.session.execute(insert(Cast.__table__), [
+        {"mov_id": rng.randint(1, movies), "act_id": first + i, "cas_role": f"Extra {first + i} {n}"}
+        for i in range(count) for n in range(casts_per_actor)])
+    db.session.commit()
+    return list(range(first, first + count))
@@ -0,0 +1,292 @@
+"""
+Closed-loop load test against the app served by gunicorn (app:app).
+
+Seeds a local database (see fixtures.py), starts gunicorn with each of the
+given worker counts and lets --concurrency client threads send a weighted mix
+of requests for --duration seconds, each thread waiting for its response
+before sending the next. Reports throughput, latency percentiles and error
+rates per route and per worker count. Tokens are signed with a local test key.
+
+Usage (from the repository root):
+    python bench/load.py --workers 1,2,4 --concurrency 16 --duration 30
+    python bench/load.py --mix movie_cast=60,actor_portfolio=30,create_cast=10
+    python bench/load.py --url http://127.0.0.1:8000 --duration 60
+
+SQLite serializes writes across the gunicorn workers, use --database-url with
+a Postgres database to size the dynos.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import itertools
+import subprocess
+import http.client
+from collections import deque
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixtures import LocalAuth, seed, seeded_counts, create_bench_app, create_delete_targets
+from api import DEFAULT_DATABASE, percentile
+
+DEFAULT_MIX = "movie_cast=35,actor_portfolio=30,create_cast=10,create_actor=10,create_movie=5,delete_cast=5,delete_actor=5"
+ROUTES = ("create_movie", "create_actor", "create_cast", "movie_cast", "actor_portfolio", "delete_cast", "delete_actor")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        route, _, weight = part.partition("=")
+        if route.strip() not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown route {route!r}, choose from {', '.join(ROUTES)}")
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+
+class LoadState:
+    """
+    Ids shared by the client threads: actors and casts created during the run
+    (and the prepared delete targets) are what the delete routes remove.
+    """
+
+    def __init__(self, movies, actors, delete_targets):
+        self.movies = movies
+        self.actors = actors
+        self.deletable_actors = deque(delete_targets)
+        self.deletable_casts = deque()
+        self._roles = itertools.count()
+        self._run = format(int(time.time()) % 0xFFFFFF, "x")
+
+    def role(self):
+        return f"Load {self._run} {next(self._roles)}"
+
+
+def build_request(route, state, rng):
+    """
+    Returns (method, path, body) for the route, or None when there is nothing to delete
+    """
+    if route == "create_movie":
+        return "POST", "/movie/create", {"mov_title": "Load movie", "mov_release": 2000, "mov_language": "en"}
+    if route == "create_actor":
+        return "POST", "/actor/create", {"act_firstname": "Load", "act_lastname": "Actor", "act_language": "en", "act_gender": "female"}
+    if route == "create_cast":
+        return "POST", "/cast/create", {"mov_id": rng.randint(1, state.movies), "act_id": rng.randint(1, state.actors), "cas_role": state.role()}
+    if route == "movie_cast":
+        return "GET", f"/movie/{rng.randint(1, state.movies)}/cast", None
+    if route == "actor_portfolio":
+        return "GET", f"/actor/{rng.randint(1, state.actors)}/casts", None
+    try:
+        if route == "delete_cast":
+            mov_id, act_id = state.deletable_casts.popleft()
+            return "POST", f"/movie/{mov_id}/cast/delete/{act_id}", None
+        return "DELETE", f"/actor/{state.deletable_actors.popleft()}", None
+    except IndexError:
+        return None
+
+
+def remember(route, state, response_body):
+    # Created actors and casts become delete targets
+    try:
+        data = json.loads(response_body).get("data") or {}
+    except ValueError:
+        return
+    if route == "create_actor" and "act_id" in data:
+        state.deletable_actors.append(data["act_id"])
+    elif route == "create_cast" and "mov_id" in data:
+        state.deletable_casts.append((data["mov_id"], data["act_id"]))
+
+
+def client_loop(base_url, token, mix, state, deadline, think, seed_value, samples):
+    target = urlsplit(base_url)
+    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+    rng = random.Random(seed_value)
+    routes, weights = list(mix), list(mix.values())
+    headers = {"Authorization": "Bearer " + token, "Content-Type": "application/json"}
+
+    while time.monotonic() < deadline:
+        route = rng.choices(routes, weights)[0]
+        request = build_request(route, state, rng)
+        if request is None:
+            route = "movie_cast"
+            request = build_request(route, state, rng)
+        method, path, body = request
+
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = connection.getresponse()
+            response_body = response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            ok, response_body = False, b""
+        samples.append((route, time.perf_counter() - start, ok))
+
+        if ok and route in ("create_actor", "create_cast"):
+            remember(route, state, response_body)
+        if think:
+            time.sleep(think)
+    connection.close()
+
+
+def run_load(base_url, token, mix, state, concurrency, duration, think, seed_value):
+    samples = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=client_loop,
+                         args=(base_url, token, mix, state, deadline, think, seed_value + n, samples))
+        for n in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    def stats(latencies, errors):
+        values = sorted(latencies)
+        return {
+            "requests": len(values),
+            "rps": round(len(values) / elapsed, 1),
+            "error_rate": round(errors / len(values), 4) if values else 0.0,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2) if values else None,
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2) if values else None,
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+        }
+
+    routes = {}
+    for route, latency, ok in samples:
+        latencies, errors = routes.setdefault(route, ([], [0]))
+        latencies.append(latency)
+        if not ok:
+            errors[0] += 1
+    return {
+        "total": stats([latency for route, latency, ok in samples], sum(not ok for route, latency, ok in samples)),
+        "routes": {route: stats(latencies, errors[0]) for route, (latencies, errors) in sorted(routes.items())},
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, port, environ):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{port}",
+         "--log-level", "warning", "app:app"],
+        cwd=ROOT, env=environ)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/status/pool")
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def print_report(label, result):
+    total = result["total"]
+    print(f"\n{label}: {total['rps']} req/s, p95 {total['p95_ms']} ms, errors {total['error_rate']:.2%}")
+    print(f"{'route':<18}{'requests':>10}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for route, stats in result["routes"].items():
+        print(f"{route:<18}{stats['requests']:>10}{stats['rps']:>9}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['error_rate']:>9.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE, help="database to seed and serve")
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--actors", type=int, default=10000)
+    parser.add_argument("--casts", type=int, default=200000)
+    parser.add_argument("--reseed", action="store_true", help="seed even if the database already has the requested counts")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated gunicorn worker counts to test")
+    parser.add_argument("--url", help="load an already running server instead of starting gunicorn")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads (closed loop)")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per worker count")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause of a client between its requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"route weights (default {DEFAULT_MIX})")
+    parser.add_argument("--delete-targets", type=int, default=2000, help="actors with casts prepared for delete_actor")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # The app (here and in gunicorn) reads its settings from the environment
+    auth = LocalAuth(tempfile.mkdtemp(prefix="casting_load_"))
+    os.environ.update(auth.environ())
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "DATABASE_URL_TEST": args.database_url,
+        "CACHE_BACKEND": "memory" if args.cache else "none",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "SERVER_TIMING": "false",
+        # The co-star graph isn't benchmarked, don't build it in the background
+        "COSTAR_PRELOAD": "false",
+    })
+
+    from model import db
+
+    app = create_bench_app(args.database_url)
+    rng = random.Random(args.seed)
+    with app.app_context():
+        if args.reseed or seeded_counts(db) != (args.movies, args.actors, args.casts):
+            print(f"Seeding {args.movies} movies, {args.actors} actors, {args.casts} casts ...", file=sys.stderr)
+            seed(db, args.movies, args.actors, args.casts)
+        delete_targets = create_delete_targets(db, args.delete_targets, args.movies, rng) if "delete_actor" in args.mix else []
+        db.session.remove()
+
+    state = LoadState(args.movies, args.actors, delete_targets)
+    token = auth.token()
+    results = {}
+
+    if args.url:
+        samples, elapsed = run_load(args.url, token, args.mix, state, args.concurrency, args.duration, args.think_ms / 1000, args.seed)
+        results["external"] = summarize(samples, elapsed)
+        print_report(f"{args.url}, {args.concurrency} clients", results["external"])
+    else:
+        for workers in (int(count) for count in args.workers.split(",")):
+            port = free_port()
+            process = start_server(workers, port, dict(os.environ))
+            try:
+                samples, elapsed = run_load(f"http://127.0.0.1:{port}", token, args.mix, state,
+                                            args.concurrency, args.duration, args.think_ms / 1000, args.seed)
+            finally:
+                stop_server(process)
+            results[f"workers={workers}"] = summarize(samples, elapsed)
+            print_report(f"{workers} gunicorn worker(s), {args.concurrency} clients", results[f"workers={workers}"])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"concurrency": args.concurrency, "duration": args.duration, "mix": args.mix, "results": results}, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Startup benchmark: the time to import app.py (which creates the app) and the
+latency of the first request, each measured in a fresh Python process.
+
+Usage (from the repository root, with the usual environment variables set):
+    python bench/startup.py --runs 10 --path /status/pool
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child process, prints the timings in milliseconds as JSON
+CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+# The monitoring endpoints (/status/*) need a token
+headers = {"Authorization": "Bearer " + os.environ["METRICS_TOKEN"]} if os.environ.get("METRICS_TOKEN") else {}
+response = app.app.test_client().get(sys.argv[1], headers=headers)
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (done - imported) * 1000,
+    "total_ms": (done - start) * 1000,
+    "status": response.status_code
+}))
+"""
+
+
+def measure(path):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, path],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    # The app logs to stdout as well, pick the line with the timings
+    line = next(line for line in result.stdout.splitlines() if '"first_request_ms"' in line)
+    return json.loads(line)
+
+
+def summarize(runs, key):
+    values = [run[key] for run in runs]
+    return {
+        "min": round(min(values), 1),
+        "median": round(statistics.median(values), 1),
+        "max": round(max(values), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh processes to start")
+    parser.add_argument("--path", default="/status/pool", help="path of the first request")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    runs = [measure(args.path) for _ in range(args.runs)]
+    results = {
+        "runs": args.runs,
+        "path": args.path,
+        "status": sorted({run["status"] for run in runs}),
+        "import_ms": summarize(runs, "import_ms"),
+        "first_request_ms": summarize(runs, "first_request_ms"),
+        "total_ms": summarize(runs, "total_ms")
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    print(f"{args.runs} runs, first request GET {args.path} -> {results['status']}")
+    for key in ("import_ms", "first_request_ms", "total_ms"):
+        stats = results[key]
+        print(f"{key:<18} min {stats['min']:>8}  median {stats['median']:>8}  max {stats['max']:>8}")
+
+
+if __name__ == "__main__":
+    main()
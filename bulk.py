@@ -0,0 +1,273 @@
+from os import environ as env
+from itertools import islice
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from model import db, Movie, Actor, Cast, touchVersions
+
+# Validation and batched inserts for bulk loads of movies, actors and casts,
+# batched deletes of movies and actors.
+# The create_* functions are shared by the bulk endpoints and the background
+# jobs (jobs.py), callers commit.
+
+BULK_BATCH_SIZE = int(env.get("BULK_BATCH_SIZE", 1000))
+BULK_MAX_ITEMS = int(env.get("BULK_MAX_ITEMS", 10000))
+
+
+class ValidationError(Exception):
+    pass
+
+
+def chunked(iterable, size=BULK_BATCH_SIZE):
+    """
+    Yields lists of at most `size` items from the iterable
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _text(item, field, max_length, required=False):
+    value = item.get(field)
+    if value is None or value == "":
+        if required:
+            raise ValidationError(f"Mandatory value for {field} is missing.")
+        return None
+    if not isinstance(value, str):
+        raise ValidationError(f"{field} must be a string.")
+    if len(value) > max_length:
+        raise ValidationError(f"{field} is longer than {max_length} characters.")
+    return value
+
+
+def _integer(item, field, required=False):
+    value = item.get(field)
+    if value is None or value == "":
+        if required:
+            raise ValidationError(f"Mandatory value for {field} is missing.")
+        return None
+    if isinstance(value, bool):
+        raise ValidationError(f"{field} must be a number.")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{field} must be a number.")
+
+
+def validate_movie(item):
+    """
+    Returns the insert values of a movie record, raises ValidationError if the record is invalid
+    """
+    if not isinstance(item, dict):
+        raise ValidationError("Movie must be an object.")
+    mov_release = _integer(item, 'mov_release', required=True)
+    if not 1920 <= mov_release <= 2030:
+        raise ValidationError("mov_release must be between 1920 and 2030.")
+    return {
+        'mov_title': _text(item, 'mov_title', 30, required=True),
+        'mov_release': mov_release,
+        'mov_language': _text(item, 'mov_language', 2)
+    }
+
+
+def validate_actor(item):
+    """
+    Returns the insert values of an actor record, raises ValidationError if the record is invalid
+    """
+    if not isinstance(item, dict):
+        raise ValidationError("Actor must be an object.")
+    return {
+        'act_firstname': _text(item, 'act_firstname', 25, required=True),
+        'act_lastname': _text(item, 'act_lastname', 25, required=True),
+        'act_language': _text(item, 'act_language', 2),
+        'act_gender': _text(item, 'act_gender', 6)
+    }
+
+
+def validate_cast(item):
+    """
+    Returns the insert values of a cast record, raises ValidationError if the record is invalid
+    """
+    if not isinstance(item, dict):
+        raise ValidationError("Cast must be an object.")
+    return {
+        'mov_id': _integer(item, 'mov_id', required=True),
+        'act_id': _integer(item, 'act_id', required=True),
+        'cas_role': _text(item, 'cas_role', 35, required=True)
+    }
+
+
+def validate_items(items, validator, offset=0):
+    """
+    Validates all items in one pass. Returns the per-item results (None for
+    valid items) and the (position, row) pairs to insert. Results are numbered
+    from `offset`, the index of the first item in the whole request.
+    """
+    results = [None] * len(items)
+    rows = []
+    for position, item in enumerate(items):
+        try:
+            rows.append((position, validator(item)))
+        except ValidationError as err_item:
+            results[position] = {"index": offset + position, "success": False, "error": str(err_item)}
+    return results, rows
+
+
+def cast_key(row):
+    return (row['mov_id'], row['act_id'], row['cas_role'])
+
+
+def existing_ids(column, ids):
+    """
+    Returns the subset of ids that exist in the given primary key column
+    """
+    found = set()
+    for chunk in chunked(sorted(set(ids))):
+        found.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+def insert_movies(rows):
+    """
+    Inserts movies in batches, returns the new mov_ids in the order of the rows
+    """
+    ids = []
+    stmt = insert(Movie).returning(Movie.mov_id, sort_by_parameter_order=True)
+    for chunk in chunked(rows):
+        ids.extend(db.session.execute(stmt, chunk).scalars())
+    return ids
+
+
+def insert_actors(rows):
+    """
+    Inserts actors in batches, returns the new act_ids in the order of the rows
+    """
+    ids = []
+    stmt = insert(Actor).returning(Actor.act_id, sort_by_parameter_order=True)
+    for chunk in chunked(rows):
+        ids.extend(db.session.execute(stmt, chunk).scalars())
+    return ids
+
+
+def insert_casts(rows):
+    """
+    Inserts casts in batches and skips the ones that already exist.
+    Returns a dict of (mov_id, act_id, cas_role) -> cas_id of the inserted casts.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(Cast).on_conflict_do_nothing(index_elements=['mov_id', 'act_id', 'cas_role'])
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(Cast).on_conflict_do_nothing(index_elements=['mov_id', 'act_id', 'cas_role'])
+    else:
+        stmt = None
+
+    inserted = {}
+    for chunk in chunked(rows):
+        if stmt is None:
+            # No ON CONFLICT support, filter the existing casts with one query per batch
+            existing = set(db.session.execute(
+                select(Cast.mov_id, Cast.act_id, Cast.cas_role).where(
+                    Cast.mov_id.in_({row['mov_id'] for row in chunk}),
+                    Cast.act_id.in_({row['act_id'] for row in chunk}))
+            ).tuples())
+            chunk = [row for row in chunk if cast_key(row) not in existing]
+            if not chunk:
+                continue
+            batch_stmt = insert(Cast)
+        else:
+            batch_stmt = stmt
+        result = db.session.execute(
+            batch_stmt.returning(Cast.cas_id, Cast.mov_id, Cast.act_id, Cast.cas_role), chunk)
+        for cas_id, mov_id, act_id, cas_role in result.tuples():
+            inserted[(mov_id, act_id, cas_role)] = cas_id
+    return inserted
+
+
+def delete_movies(mov_ids):
+    """
+    Deletes movies in batches, one DELETE per batch. Their casts are removed by
+    the database (ON DELETE CASCADE). Returns the deleted mov_ids and the
+    act_ids of the actors that were in their casts.
+    """
+    deleted, act_ids = set(), set()
+    for chunk in chunked(sorted(set(mov_ids))):
+        act_ids.update(db.session.execute(select(Cast.act_id).where(Cast.mov_id.in_(chunk)).distinct()).scalars())
+        deleted.update(db.session.execute(
+            delete(Movie).where(Movie.mov_id.in_(chunk)).returning(Movie.mov_id)).scalars())
+    return deleted, act_ids
+
+
+def delete_actors(act_ids):
+    """
+    Deletes actors in batches, one DELETE per batch. Their casts are removed by
+    the database (ON DELETE CASCADE). Returns the deleted act_ids and the
+    mov_ids of the movies they performed in.
+    """
+    deleted, mov_ids = set(), set()
+    for chunk in chunked(sorted(set(act_ids))):
+        mov_ids.update(db.session.execute(select(Cast.mov_id).where(Cast.act_id.in_(chunk)).distinct()).scalars())
+        deleted.update(db.session.execute(
+            delete(Actor).where(Actor.act_id.in_(chunk)).returning(Actor.act_id)).scalars())
+    return deleted, mov_ids
+
+
+def create_movies(items, offset=0):
+    """
+    Validates and inserts movies, returns the per-item results
+    """
+    results, rows = validate_items(items, validate_movie, offset)
+    mov_ids = insert_movies([row for position, row in rows])
+    for (position, row), mov_id in zip(rows, mov_ids):
+        results[position] = {"index": offset + position, "success": True, "mov_id": mov_id}
+    return results
+
+
+def create_actors(items, offset=0):
+    """
+    Validates and inserts actors, returns the per-item results
+    """
+    results, rows = validate_items(items, validate_actor, offset)
+    act_ids = insert_actors([row for position, row in rows])
+    for (position, row), act_id in zip(rows, act_ids):
+        results[position] = {"index": offset + position, "success": True, "act_id": act_id}
+    return results
+
+
+def create_casts(items, offset=0):
+    """
+    Validates and inserts casts and bumps the versions of their movies and
+    actors. Returns the per-item results and the mov_ids and act_ids whose
+    cached responses are stale once committed.
+    """
+    results, rows = validate_items(items, validate_cast, offset)
+    mov_ids = existing_ids(Movie.mov_id, [row['mov_id'] for position, row in rows])
+    act_ids = existing_ids(Actor.act_id, [row['act_id'] for position, row in rows])
+
+    valid_rows = []
+    seen = set()
+    for position, row in rows:
+        if row['mov_id'] not in mov_ids or row['act_id'] not in act_ids:
+            results[position] = {"index": offset + position, "success": False, "error": "Movie or actor not found"}
+        elif cast_key(row) in seen:
+            results[position] = {"index": offset + position, "success": False, "error": "Duplicate entry. Cast already exists."}
+        else:
+            seen.add(cast_key(row))
+            valid_rows.append((position, row))
+
+    inserted = insert_casts([row for position, row in valid_rows])
+    movie_ids = {mov_id for mov_id, act_id, cas_role in inserted}
+    actor_ids = {act_id for mov_id, act_id, cas_role in inserted}
+    touchVersions(movie_ids=movie_ids, actor_ids=actor_ids)
+
+    for position, row in valid_rows:
+        cas_id = inserted.get(cast_key(row))
+        if cas_id is None:
+            results[position] = {"index": offset + position, "success": False, "error": "Duplicate entry. Cast already exists."}
+        else:
+            results[position] = {"index": offset + position, "success": True, "cas_id": cas_id}
+    return results, movie_ids, actor_ids
@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from os import environ as env
+
+# Response cache for cast lists and actor portfolios.
+# The cache is filled by the read handlers and invalidated by the mutation
+# handlers after their commit. The backend is an in-process LRU by default,
+# CACHE_BACKEND=redis (with CACHE_URL) shares it between processes.
+
+CACHE_BACKEND = env.get("CACHE_BACKEND", "memory")
+CACHE_URL = env.get("CACHE_URL", "redis://localhost:6379/0")
+CACHE_SIZE = int(env.get("CACHE_SIZE", 10000))
+CACHE_TTL = int(env.get("CACHE_TTL", 3600))
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Bounded in-process cache, least recently used entries are evicted first
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """
+    Cache in Redis (or a Redis compatible server), shared by all processes.
+    Values are stored as JSON and expire after `ttl` seconds.
+    """
+
+    def __init__(self, url=CACHE_URL, ttl=CACHE_TTL, prefix="casting:"):
+        # Optional dependency, only needed when this backend is configured
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self._client.delete(*keys)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self.prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def size(self):
+        return None
+
+
+class ResponseCache:
+    """
+    Keeps the hit/miss counters and the key scheme on top of a cache backend.
+
+    Every invalidation bumps a generation counter, a loader result is only
+    stored when no invalidation happened while it was loading. That keeps a
+    slow reader from putting back data that a concurrent write just replaced.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def movie_cast_key(mov_id):
+        return f"movie_cast:{mov_id}"
+
+    @staticmethod
+    def actor_portfolio_key(act_id):
+        return f"actor_portfolio:{act_id}"
+
+    def get_or_load(self, key, loader, version=None):
+        """
+        Returns the cached value of key, or calls loader and caches its result.
+        A cached value only counts when it was stored for the same `version`
+        (change counter of the entity), so an entry that another process
+        failed to invalidate is never served. None results (e.g. not found)
+        are not cached.
+        """
+        try:
+            cached = self.backend.get(key)
+        except Exception as err_cache:
+            logger.warning("Cache unavailable: %s", err_cache)
+            return loader()
+
+        if cached is not None and cached[0] == version:
+            with self._lock:
+                self.hits += 1
+            return cached[1]
+
+        with self._lock:
+            self.misses += 1
+            generation = self._generation
+        value = loader()
+        if value is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._set(key, [version, value])
+        return value
+
+    def _set(self, key, value):
+        try:
+            self.backend.set(key, value)
+        except Exception as err_cache:
+            logger.warning("Cache unavailable: %s", err_cache)
+
+    def invalidate(self, movie_ids=(), actor_ids=()):
+        """
+        Drops the cached cast lists of the movies and portfolios of the actors
+        """
+        keys = [self.movie_cast_key(mov_id) for mov_id in set(movie_ids)]
+        keys += [self.actor_portfolio_key(act_id) for act_id in set(actor_ids)]
+        with self._lock:
+            self._generation += 1
+            try:
+                self.backend.delete(keys)
+            except Exception as err_cache:
+                logger.warning("Cache unavailable: %s", err_cache)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            try:
+                self.backend.clear()
+            except Exception as err_cache:
+                logger.warning("Cache unavailable: %s", err_cache)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": self.backend.size(),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None
+        }
+
+
+def make_backend(name=CACHE_BACKEND):
+    if name == "redis":
+        return RedisCache()
+    return LRUCache(maxsize=CACHE_SIZE if name == "memory" else 0)
+
+
+response_cache = ResponseCache(make_backend())
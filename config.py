@@ -2,6 +2,63 @@ from os import environ as env
 from dotenv import load_dotenv
 load_dotenv()
 
+from dbpool import InstrumentedQueuePool
+from routing import REPLICA_BIND_PREFIX
+
+
+def engine_options(database_uri, pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping, statement_timeout):
+    """
+    SQLAlchemy engine options for the connection pool of the given database.
+    statement_timeout is in milliseconds and only applies to PostgreSQL.
+    """
+    if not database_uri or database_uri in ("sqlite://", "sqlite:///:memory:"):
+        # In-memory SQLite lives in a single connection, keep the default pool
+        return {}
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping,
+    }
+    if database_uri.startswith(("postgres://", "postgresql")) and statement_timeout:
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+def pool_options(pool_size, max_overflow, pool_timeout, statement_timeout):
+    """
+    Pool settings from the environment, falling back to the given defaults
+    """
+    return {
+        "pool_size": int(env.get("DB_POOL_SIZE", pool_size)),
+        "max_overflow": int(env.get("DB_MAX_OVERFLOW", max_overflow)),
+        "pool_timeout": int(env.get("DB_POOL_TIMEOUT", pool_timeout)),
+        "pool_recycle": int(env.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": env.get("DB_POOL_PRE_PING", "true").lower() == "true",
+        "statement_timeout": int(env.get("DB_STATEMENT_TIMEOUT", statement_timeout)),
+    }
+
+
+def replica_binds(urls, **options):
+    """
+    SQLALCHEMY_BINDS entries (replica_0, replica_1, ...) for a comma separated
+    list of read replica URLs, with the same pool settings as the primary
+    """
+    binds = {}
+    for url in (url.strip() for url in (urls or "").split(",")):
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        if url:
+            binds[f"{REPLICA_BIND_PREFIX}{len(binds)}"] = dict(engine_options(url, **options), url=url)
+    return binds
+
+
+PRODUCTION_POOL = pool_options(pool_size=5, max_overflow=10, pool_timeout=30, statement_timeout=30000)
+TESTING_POOL = pool_options(pool_size=2, max_overflow=2, pool_timeout=5, statement_timeout=10000)
+
+
 class Config:
     DEBUG = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -15,9 +72,14 @@ class Config:
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = env.get("DATABASE_URL")
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, **PRODUCTION_POOL)
+    # Read replicas, comma separated URLs
+    SQLALCHEMY_BINDS = replica_binds(env.get("DATABASE_REPLICA_URLS"), **PRODUCTION_POOL)
     # to-do: add other production-specific configuration options
 
 class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = env.get("DATABASE_URL_TEST")
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, **TESTING_POOL)
+    SQLALCHEMY_BINDS = replica_binds(env.get("DATABASE_REPLICA_URLS_TEST"), **TESTING_POOL)
     TESTING = True
     # to-do: ther testing-specific configuration options
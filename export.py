@@ -0,0 +1,67 @@
+import io
+import csv
+import json
+from os import environ as env
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from model import db, Movie, Actor, Cast
+
+# Streaming export of movies, actors or casts as NDJSON or CSV.
+# Rows are read as plain tuples through a server-side cursor (yield_per), so
+# they never enter the ORM identity map and memory stays flat for any table size.
+
+EXPORT_BATCH_SIZE = int(env.get("EXPORT_BATCH_SIZE", 5000))
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+COLUMNS = {
+    'movies': (Movie.mov_id, Movie.mov_title, Movie.mov_release, Movie.mov_language),
+    'actors': (Actor.act_id, Actor.act_firstname, Actor.act_lastname, Actor.act_language, Actor.act_gender),
+    'casts': (Cast.cas_id, Cast.mov_id, Cast.act_id, Cast.cas_role)
+}
+
+
+def _ndjson(names, rows):
+    return ''.join(json.dumps(dict(zip(names, row))) + '\n' for row in rows)
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+def export_rows(kind, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the table of the given kind as NDJSON or CSV text, one chunk per batch of rows
+    """
+    columns = COLUMNS[kind]
+    names = [column.key for column in columns]
+
+    if fmt == 'csv':
+        yield _csv([names])
+
+    result = db.session.execute(
+        select(*columns).order_by(columns[0]).execution_options(yield_per=batch_size))
+    try:
+        for rows in result.partitions():
+            yield _ndjson(names, rows) if fmt == 'ndjson' else _csv(rows)
+    finally:
+        result.close()
+        db.session.close()
+
+
+@click.command('export-catalogue')
+@click.option('--kind', type=click.Choice(list(COLUMNS)), required=True, help='Table to export.')
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='ndjson', show_default=True)
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='File to write to, stdout by default.')
+@with_appcontext
+def export_catalogue_command(kind, fmt, output):
+    """Export movies, actors or casts as NDJSON or CSV."""
+    for chunk in export_rows(kind, fmt):
+        output.write(chunk)
@@ -0,0 +1,372 @@
+import time
+import heapq
+import logging
+import threading
+from array import array
+from collections import Counter
+from os import environ as env
+
+from sqlalchemy import select
+
+from model import db, Cast
+from bulk import chunked
+from lifecycle import start_in_serving_process
+
+# Co-star graph: who has worked with whom.
+# Actors and movies form a bipartite graph held in memory as two CSR arrays
+# (movie -> actors and actor -> movies), built from one ordered scan of the
+# casts table. Cast changes made by this process mark their movies and actors
+# as dirty; the next graph query reads the edges of those from the database
+# and keeps the difference as a small delta on top of the arrays. Changes of
+# other processes are picked up by a rebuild once the graph is older than
+# COSTAR_MAX_AGE. Rebuilds run in a background thread, the old graph keeps
+# serving meanwhile.
+
+COSTAR_PRELOAD = env.get("COSTAR_PRELOAD", "true").lower() == "true"
+COSTAR_MAX_AGE = int(env.get("COSTAR_MAX_AGE", 600))
+COSTAR_MAX_DELTA = int(env.get("COSTAR_MAX_DELTA", 100000))
+COSTAR_MAX_DEPTH = int(env.get("COSTAR_MAX_DEPTH", 6))
+COSTAR_LIMIT = int(env.get("COSTAR_LIMIT", 20))
+COSTAR_BUILD_TIMEOUT = int(env.get("COSTAR_BUILD_TIMEOUT", 60))
+COSTAR_BUILD_BATCH = 50000
+
+logger = logging.getLogger(__name__)
+
+
+class GraphUnavailable(Exception):
+    pass
+
+
+class CSR:
+    """
+    Compressed sparse rows: the neighbours of node n are
+    targets[offsets[n]:offsets[n + 1]], in ascending order. Node ids index
+    the offsets directly, ids without edges have an empty range.
+    """
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+        self._view = memoryview(targets)
+
+    @classmethod
+    def from_sorted_pairs(cls, pairs):
+        """
+        Builds the rows from (node, target) pairs sorted by node and target.
+        Repeated pairs (e.g. two roles in one movie) are stored once.
+        """
+        offsets = array('l', [0])
+        # Ids are INTEGER columns, 32 bits
+        targets = array('i')
+        last = None
+        for pair in pairs:
+            if pair == last:
+                continue
+            last = pair
+            node, target = pair
+            while len(offsets) <= node:
+                offsets.append(len(targets))
+            targets.append(target)
+        offsets.append(len(targets))
+        return cls(offsets, targets)
+
+    @property
+    def size(self):
+        return len(self.offsets) - 1
+
+    def neighbors(self, node):
+        if 0 <= node < len(self.offsets) - 1:
+            return self._view[self.offsets[node]:self.offsets[node + 1]]
+        return ()
+
+    def transpose(self):
+        """
+        The reverse rows (target -> nodes), by counting sort
+        """
+        size = max(self.targets) + 1 if self.targets else 0
+        counts = array('l', [0]) * (size + 1)
+        for target in self.targets:
+            counts[target + 1] += 1
+        for node in range(size):
+            counts[node + 1] += counts[node]
+
+        positions = array('l', counts)
+        targets = array('i', [0]) * len(self.targets)
+        offsets = self.offsets
+        for node in range(self.size):
+            for index in range(offsets[node], offsets[node + 1]):
+                target = self.targets[index]
+                targets[positions[target]] = node
+                positions[target] += 1
+        return CSR(counts, targets)
+
+
+class GraphState:
+    """
+    The CSR arrays plus the edges added and removed since they were built.
+    Never changed once published, an update creates a new state.
+    """
+
+    def __init__(self, movie_rows, actor_rows, built_at, added=None, removed=frozenset()):
+        self.movie_rows = movie_rows
+        self.actor_rows = actor_rows
+        self.built_at = built_at
+        # (act_id, mov_id) pairs
+        self.added = added or frozenset()
+        self.removed = removed
+        self._added_movies = {}
+        self._added_actors = {}
+        for act_id, mov_id in self.added:
+            self._added_movies.setdefault(act_id, []).append(mov_id)
+            self._added_actors.setdefault(mov_id, []).append(act_id)
+
+    @property
+    def delta(self):
+        return len(self.added) + len(self.removed)
+
+    def movies_of(self, act_id):
+        movies = self.actor_rows.neighbors(act_id)
+        if not self.delta:
+            return movies
+        movies = [mov_id for mov_id in movies if (act_id, mov_id) not in self.removed]
+        return movies + self._added_movies.get(act_id, [])
+
+    def actors_of(self, mov_id):
+        actors = self.movie_rows.neighbors(mov_id)
+        if not self.delta:
+            return actors
+        actors = [act_id for act_id in actors if (act_id, mov_id) not in self.removed]
+        return actors + self._added_actors.get(mov_id, [])
+
+    def edges_of(self, movie_ids, actor_ids):
+        edges = {(act_id, mov_id) for mov_id in movie_ids for act_id in self.actors_of(mov_id)}
+        edges.update((act_id, mov_id) for act_id in actor_ids for mov_id in self.movies_of(act_id))
+        return edges
+
+    def with_changes(self, added, removed):
+        """
+        New state with the edges added and removed
+        """
+        next_added = (self.added - removed) | (added - self.removed)
+        next_removed = (self.removed - added) | (removed - self.added)
+        return GraphState(self.movie_rows, self.actor_rows, self.built_at, frozenset(next_added), frozenset(next_removed))
+
+
+def load_graph(connection, batch_size=COSTAR_BUILD_BATCH):
+    """
+    Builds a GraphState from the casts table, ordered by the (mov_id, act_id) index
+    """
+    result = connection.execution_options(yield_per=batch_size).execute(
+        select(Cast.mov_id, Cast.act_id).order_by(Cast.mov_id, Cast.act_id))
+    try:
+        movie_rows = CSR.from_sorted_pairs(tuple(row) for row in result)
+    finally:
+        result.close()
+    return GraphState(movie_rows, movie_rows.transpose(), time.monotonic())
+
+
+def load_edges(connection, movie_ids, actor_ids):
+    """
+    The (act_id, mov_id) edges of the given movies and actors in the database
+    """
+    edges = set()
+    for chunk in chunked(sorted(movie_ids)):
+        edges.update(connection.execute(select(Cast.act_id, Cast.mov_id).where(Cast.mov_id.in_(chunk))).tuples())
+    for chunk in chunked(sorted(actor_ids)):
+        edges.update(connection.execute(select(Cast.act_id, Cast.mov_id).where(Cast.act_id.in_(chunk))).tuples())
+    return edges
+
+
+class CostarGraph:
+    def __init__(self, max_age=COSTAR_MAX_AGE, max_delta=COSTAR_MAX_DELTA):
+        self.max_age = max_age
+        self.max_delta = max_delta
+        self._state = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._building = False
+        self._dirty_movies = set()
+        self._dirty_actors = set()
+        # Changes applied to the old state while a rebuild runs, applied again to the new one
+        self._rebuild_movies = set()
+        self._rebuild_actors = set()
+        self._app = None
+
+    def init_app(self, app):
+        self._app = app
+        if COSTAR_PRELOAD:
+            # Built in the background, current() waits for it
+            start_in_serving_process(app, self._preload)
+
+    def _preload(self):
+        if self._state is None and not self._building:
+            self._start_rebuild()
+
+    def casts_changed(self, movie_ids=(), actor_ids=()):
+        """
+        Marks the movies and actors whose casts changed, after the commit
+        """
+        with self._lock:
+            self._dirty_movies.update(movie_ids)
+            self._dirty_actors.update(actor_ids)
+
+    def reset(self):
+        """
+        Rebuilds the graph in the background, e.g. after a bulk import
+        """
+        if self._state is not None:
+            self._start_rebuild()
+
+    def _start_rebuild(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild, name="costar-graph", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            started = time.perf_counter()
+            with self._app.app_context():
+                with db.engine.connect() as connection:
+                    state = load_graph(connection)
+            with self._lock:
+                self._state = state
+                self._dirty_movies |= self._rebuild_movies
+                self._dirty_actors |= self._rebuild_actors
+                self._rebuild_movies, self._rebuild_actors = set(), set()
+            self._ready.set()
+            logger.info("Co-star graph built: %s movies, %s actors, %s edges in %.2fs", state.movie_rows.size,
+                        state.actor_rows.size, len(state.movie_rows.targets), time.perf_counter() - started)
+        except Exception:
+            logger.exception("Co-star graph build failed")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def current(self):
+        """
+        The graph with the pending changes applied. Waits for the first build.
+        Raises GraphUnavailable when there is no graph yet.
+        """
+        if self._state is None:
+            self._start_rebuild()
+            if not self._ready.wait(COSTAR_BUILD_TIMEOUT) or self._state is None:
+                raise GraphUnavailable("The co-star graph is not built yet.")
+
+        with self._lock:
+            state = self._state
+            movie_ids, actor_ids = self._dirty_movies, self._dirty_actors
+            self._dirty_movies, self._dirty_actors = set(), set()
+            if self._building:
+                self._rebuild_movies |= movie_ids
+                self._rebuild_actors |= actor_ids
+
+            if movie_ids or actor_ids:
+                # Read from the primary, a replica may not have the change yet
+                try:
+                    with db.engine.connect() as connection:
+                        edges = load_edges(connection, movie_ids, actor_ids)
+                except Exception:
+                    self._dirty_movies |= movie_ids
+                    self._dirty_actors |= actor_ids
+                    raise
+                known = state.edges_of(movie_ids, actor_ids)
+                state = state.with_changes(edges - known, known - edges)
+                self._state = state
+
+        if state.delta > self.max_delta or time.monotonic() - state.built_at > self.max_age:
+            self._start_rebuild()
+        return state
+
+    def costars(self, act_id, limit=COSTAR_LIMIT):
+        """
+        The actors who appeared in a movie with the actor, as (act_id, shared
+        movies), most shared movies first
+        """
+        state = self.current()
+        counts = Counter()
+        for mov_id in state.movies_of(act_id):
+            counts.update(state.actors_of(mov_id))
+        counts.pop(act_id, None)
+        return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def path(self, source, target, max_depth=COSTAR_MAX_DEPTH):
+        """
+        Shortest chain of actors from source to target, each pair linked by a
+        movie both appeared in, at most max_depth movies long. Returns
+        (act_ids, mov_ids), mov_ids[i] links act_ids[i] and act_ids[i + 1], or
+        None when there is no such chain.
+        """
+        if source == target:
+            return [source], []
+        state = self.current()
+
+        # Breadth-first from both ends, always growing the smaller frontier.
+        # parents: actor -> (previous actor, movie), depths: actor -> movies from the end
+        parents = ({source: None}, {target: None})
+        depths = ({source: 0}, {target: 0})
+        frontiers = [[source], [target]]
+        seen_movies = (set(), set())
+        length = 0
+        while frontiers[0] and frontiers[1] and length < max_depth:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            parent, depth, other = parents[side], depths[side], depths[1 - side]
+            next_frontier = []
+            meetings = []
+            for act_id in frontiers[side]:
+                for mov_id in state.movies_of(act_id):
+                    if mov_id in seen_movies[side]:
+                        continue
+                    seen_movies[side].add(mov_id)
+                    for costar in state.actors_of(mov_id):
+                        if costar in parent:
+                            continue
+                        parent[costar] = (act_id, mov_id)
+                        depth[costar] = depth[act_id] + 1
+                        if costar in other:
+                            meetings.append(costar)
+                        next_frontier.append(costar)
+            frontiers[side] = next_frontier
+            length += 1
+            if meetings:
+                # Finish the level, then take the shortest of the chains found
+                meeting = min(meetings, key=lambda act_id: depths[0][act_id] + depths[1][act_id])
+                if depths[0][meeting] + depths[1][meeting] <= max_depth:
+                    return self._chain(parents, meeting)
+                return None
+        return None
+
+    @staticmethod
+    def _chain(parents, meeting):
+        act_ids, mov_ids = [meeting], []
+        # Back to the source, then forward to the target
+        node = meeting
+        while parents[0][node] is not None:
+            node, mov_id = parents[0][node]
+            act_ids.insert(0, node)
+            mov_ids.insert(0, mov_id)
+        node = meeting
+        while parents[1][node] is not None:
+            node, mov_id = parents[1][node]
+            act_ids.append(node)
+            mov_ids.append(mov_id)
+        return act_ids, mov_ids
+
+    def status(self):
+        state = self._state
+        if state is None:
+            return {"ready": False, "building": self._building}
+        return {
+            "ready": True,
+            "building": self._building,
+            "movies": state.movie_rows.size,
+            "actors": state.actor_rows.size,
+            "edges": len(state.movie_rows.targets) + len(state.added) - len(state.removed),
+            "delta": state.delta,
+            "age_seconds": round(time.monotonic() - state.built_at, 1),
+            "pending": len(self._dirty_movies) + len(self._dirty_actors)
+        }
+
+
+costar_graph = CostarGraph()
@@ -0,0 +1,237 @@
+import os
+import csv
+import json
+import time
+from os import environ as env
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+
+from model import db, Movie, Actor, touchVersions
+from bulk import ValidationError, chunked, existing_ids
+from bulk import validate_movie, validate_actor, validate_cast
+from bulk import insert_movies, insert_actors, insert_casts
+
+# Streaming import of movies, actors or casts from NDJSON or CSV.
+# Records flow through a generator pipeline (parse -> validate -> insert) and
+# are committed per chunk, so memory stays flat whatever the size of the input.
+
+IMPORT_CHUNK_SIZE = int(env.get("IMPORT_CHUNK_SIZE", 5000))
+IMPORT_MAX_ERRORS = 20
+
+FORMATS = ('ndjson', 'csv')
+KINDS = {
+    'movies': validate_movie,
+    'actors': validate_actor,
+    'casts': validate_cast
+}
+
+
+class IngestError(Exception):
+    """
+    An import stopped early. `stats` are the counters up to the last commit,
+    `error` and `status_code` are what the API reports to the client.
+    """
+
+    def __init__(self, message, stats, error="Database error", status_code=500):
+        super().__init__(message)
+        self.stats = stats
+        self.error = error
+        self.status_code = status_code
+
+
+class IngestStats:
+    """
+    Counters of an import run. `position` is the number of records consumed,
+    which is the value to resume from after an interruption.
+    """
+
+    def __init__(self, position=0):
+        self.position = position
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    def error(self, record_number, message):
+        self.invalid += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"record": record_number, "error": message})
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return round(self.inserted / elapsed, 1) if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            "position": self.position,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "errors": self.errors,
+            "elapsed": round(self.elapsed, 3),
+            "rows_per_second": self.rows_per_second
+        }
+
+
+def parse_records(lines, fmt):
+    """
+    Yields the records of an NDJSON or CSV stream of text lines. A record
+    that cannot be parsed is yielded as a ValidationError.
+    """
+    if fmt == 'ndjson':
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield ValidationError("Invalid JSON.")
+    elif fmt == 'csv':
+        reader = csv.DictReader(lines)
+        try:
+            for row in reader:
+                # Empty CSV cells are missing values
+                yield {key: value for key, value in row.items() if value != ''}
+        except csv.Error as err_csv:
+            # A NUL byte (before Python 3.11) or an oversized field: the rest of
+            # the stream can't be read. DictReader.line_num is only updated after
+            # a row parses, the underlying reader has the line of the error
+            raise csv.Error(f"line {reader.reader.line_num}: {err_csv}") from err_csv
+    else:
+        raise ValueError(f"Unknown format {fmt}")
+
+
+def validate_records(records, kind, stats):
+    """
+    Yields (record number, insert values) for the valid records and counts the invalid ones
+    """
+    validator = KINDS[kind]
+    for record in records:
+        stats.position += 1
+        try:
+            if isinstance(record, ValidationError):
+                raise record
+            yield stats.position, validator(record)
+        except ValidationError as err_record:
+            stats.error(stats.position, str(err_record))
+
+
+def insert_chunk(kind, chunk, stats):
+    rows = [row for number, row in chunk]
+    if kind == 'movies':
+        stats.inserted += len(insert_movies(rows))
+    elif kind == 'actors':
+        stats.inserted += len(insert_actors(rows))
+    else:
+        mov_ids = existing_ids(Movie.mov_id, [row['mov_id'] for row in rows])
+        act_ids = existing_ids(Actor.act_id, [row['act_id'] for row in rows])
+        valid_rows = []
+        for number, row in chunk:
+            if row['mov_id'] not in mov_ids or row['act_id'] not in act_ids:
+                stats.error(number, "Movie or actor not found")
+            else:
+                valid_rows.append(row)
+        inserted = insert_casts(valid_rows)
+        touchVersions(
+            movie_ids=[mov_id for mov_id, act_id, cas_role in inserted],
+            actor_ids=[act_id for mov_id, act_id, cas_role in inserted])
+        stats.inserted += len(inserted)
+        stats.duplicates += len(valid_rows) - len(inserted)
+
+
+def ingest(lines, fmt, kind, skip=0, chunk_size=IMPORT_CHUNK_SIZE, on_commit=None):
+    """
+    Imports the records of an NDJSON or CSV stream, committing every
+    `chunk_size` records. The first `skip` records are passed over, which
+    resumes an earlier run. `on_commit(stats)` is called after each commit.
+    Raises IngestError, holding the stats up to the last commit, on database
+    errors and on input that isn't valid UTF-8 or can't be read as CSV.
+    """
+    stats = IngestStats(position=skip)
+    records = islice(parse_records(lines, fmt), skip, None)
+
+    # The position of the last commit is kept, so a failed chunk is retried on resume
+    committed = (skip, 0, 0)
+    try:
+        for chunk in chunked(validate_records(records, kind, stats), chunk_size):
+            insert_chunk(kind, chunk, stats)
+            db.session.commit()
+            committed = (stats.position, stats.inserted, stats.duplicates)
+            if on_commit:
+                on_commit(stats)
+    except SQLAlchemyError as err_ingest:
+        db.session.rollback()
+        stats.position, stats.inserted, stats.duplicates = committed
+        raise IngestError(str(err_ingest), stats) from err_ingest
+    except UnicodeDecodeError as err_decode:
+        db.session.rollback()
+        stats.position, stats.inserted, stats.duplicates = committed
+        raise IngestError(f"Input is not valid UTF-8: {err_decode}", stats,
+                          error="Request body must be UTF-8 encoded.", status_code=400) from err_decode
+    except csv.Error as err_csv:
+        db.session.rollback()
+        stats.position, stats.inserted, stats.duplicates = committed
+        raise IngestError(f"Input is not valid CSV at {err_csv}", stats,
+                          error=f"Request body is not valid CSV at {err_csv}.", status_code=400) from err_csv
+    finally:
+        db.session.close()
+    return stats
+
+
+def read_checkpoint(path, source):
+    try:
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return 0
+    return checkpoint.get("position", 0) if checkpoint.get("source") == source else 0
+
+
+def write_checkpoint(path, source, position):
+    # Write and rename, so an interrupted write never leaves a broken checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump({"source": source, "position": position}, checkpoint_file)
+    os.replace(tmp_path, path)
+
+
+@click.command('import-catalogue')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--kind', type=click.Choice(list(KINDS)), required=True, help='Type of the records in the file.')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='File format, derived from the file extension by default.')
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, show_default=True, help='Records per transaction.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None, help='File to store the progress in, an existing checkpoint resumes the import.')
+@with_appcontext
+def import_catalogue_command(path, kind, fmt, chunk_size, checkpoint):
+    """Import movies, actors or casts from an NDJSON or CSV file."""
+    if fmt is None:
+        fmt = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+    source = os.path.abspath(path)
+    skip = read_checkpoint(checkpoint, source) if checkpoint else 0
+    if skip:
+        click.echo(f"Resuming {path} after record {skip}")
+
+    def report(stats):
+        if checkpoint:
+            write_checkpoint(checkpoint, source, stats.position)
+        click.echo(f"{stats.position} records, {stats.inserted} inserted, {stats.rows_per_second} rows/s")
+
+    with open(path, newline='', encoding='utf-8') as import_file:
+        try:
+            stats = ingest(import_file, fmt, kind, skip=skip, chunk_size=chunk_size, on_commit=report)
+        except IngestError as err_import:
+            raise click.ClickException(f"Import stopped after record {err_import.stats.position}: {err_import}")
+
+    if checkpoint:
+        write_checkpoint(checkpoint, source, stats.position)
+    click.echo(json.dumps(stats.to_dict(), indent=4))
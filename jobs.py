@@ -0,0 +1,282 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from os import environ as env
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from model import db, Job, touchVersions
+from bulk import BULK_BATCH_SIZE, create_movies, create_actors, create_casts, delete_movies, delete_actors
+from cache import response_cache
+from graph import costar_graph
+from lifecycle import start_in_serving_process
+
+# Background jobs without a broker.
+# A heavy bulk operation is stored as a row of the jobs table and returns at
+# once; a worker (threads in the app process, JOB_WORKER=thread, or a separate
+# `flask run-jobs` process) claims the row and runs it in chunks. Each chunk is
+# committed together with the progress of the job, so a job taken over after a
+# crashed worker resumes right after the last committed chunk.
+
+JOB_WORKER = env.get("JOB_WORKER", "thread")
+JOB_WORKER_THREADS = int(env.get("JOB_WORKER_THREADS", 1))
+JOB_POLL_INTERVAL = float(env.get("JOB_POLL_INTERVAL", 2))
+JOB_CHUNK_SIZE = int(env.get("JOB_CHUNK_SIZE", BULK_BATCH_SIZE))
+JOB_STALE_SECONDS = int(env.get("JOB_STALE_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(env.get("JOB_MAX_ATTEMPTS", 3))
+# Bulk requests with more items run as a job
+JOB_INLINE_MAX_ITEMS = int(env.get("JOB_INLINE_MAX_ITEMS", 1000))
+
+logger = logging.getLogger(__name__)
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobKind:
+    def __init__(self, run, permission):
+        self.run = run
+        self.permission = permission
+
+
+# kind -> JobKind
+JOB_KINDS = {}
+
+
+def job_kind(name, permission):
+    """
+    Registers a job handler. It is called with a chunk of the items and the
+    index of the first one, and returns a summary of the chunk (counters and
+    lists, added up over the chunks) and the mov_ids and act_ids whose cached
+    responses are stale once the chunk is committed.
+    """
+    def decorator(f):
+        JOB_KINDS[name] = JobKind(f, permission)
+        return f
+    return decorator
+
+
+@job_kind('create_movies', 'post:movie')
+def run_create_movies(items, offset):
+    return create_summary(create_movies(items, offset)), (), ()
+
+
+@job_kind('create_actors', 'post:actor')
+def run_create_actors(items, offset):
+    return create_summary(create_actors(items, offset)), (), ()
+
+
+@job_kind('create_casts', 'post:cast')
+def run_create_casts(items, offset):
+    results, mov_ids, act_ids = create_casts(items, offset)
+    return create_summary(results), mov_ids, act_ids
+
+
+@job_kind('delete_movies', 'delete:movie')
+def run_delete_movies(items, offset):
+    deleted, act_ids = delete_movies(items)
+    touchVersions(actor_ids=act_ids)
+    return delete_summary(items, deleted), deleted, act_ids
+
+
+@job_kind('delete_actors', 'delete:actor')
+def run_delete_actors(items, offset):
+    deleted, mov_ids = delete_actors(items)
+    touchVersions(movie_ids=mov_ids)
+    return delete_summary(items, deleted), mov_ids, deleted
+
+
+def create_summary(results):
+    created = sum(1 for result in results if result["success"])
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+def delete_summary(ids, deleted):
+    return {"deleted": len(deleted), "not_found": [item for item in ids if item not in deleted]}
+
+
+def merge_summary(summary, part):
+    for key, value in part.items():
+        summary[key] = summary.get(key, type(value)()) + value
+    return summary
+
+
+def enqueue(kind, items):
+    """
+    Stores a job for the items and wakes the local worker, returns the job
+    """
+    job = Job(job_id=uuid.uuid4().hex, job_kind=kind, job_status='queued', job_params=json.dumps(items),
+              job_total=len(items), job_done=0, job_attempts=0, job_created=utcnow())
+    db.session.add(job)
+    db.session.commit()
+    job_worker.wake()
+    return job
+
+
+def job_status(job):
+    """
+    Status of a job for the API. The result is included once the job is done.
+    """
+    return {
+        "job_id": job.job_id,
+        "kind": job.job_kind,
+        "status": job.job_status,
+        "total": job.job_total,
+        "done": job.job_done,
+        "created": job.job_created.isoformat() + "Z",
+        "finished": job.job_finished.isoformat() + "Z" if job.job_finished else None,
+        "error": job.job_error,
+        "result": json.loads(job.job_result) if job.job_status == 'done' and job.job_result else None
+    }
+
+
+def claim_job():
+    """
+    Marks the oldest queued job, or a running job whose worker stopped
+    reporting for JOB_STALE_SECONDS, as running. Returns (job_id, attempt),
+    or None when there is nothing to run. The attempt counter fences off the
+    worker that held the job before.
+    """
+    stale = utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    candidate = db.session.execute(
+        select(Job.job_id, Job.job_attempts)
+        .where(or_(Job.job_status == 'queued', and_(Job.job_status == 'running', Job.job_heartbeat < stale)))
+        .order_by(Job.job_created)
+        .limit(1)
+    ).first()
+    if candidate is None:
+        return None
+
+    job_id, attempts = candidate
+    claim = update(Job).where(Job.job_id == job_id, Job.job_attempts == attempts)
+    if attempts >= JOB_MAX_ATTEMPTS:
+        db.session.execute(claim.values(job_status='failed', job_finished=utcnow(),
+                                        job_error=f"Worker stopped {attempts} times while running the job."))
+        db.session.commit()
+        return None
+    claimed = db.session.execute(claim.values(job_status='running', job_attempts=attempts + 1, job_heartbeat=utcnow()))
+    db.session.commit()
+    # Another worker was faster, the next poll looks again
+    return (job_id, attempts + 1) if claimed.rowcount == 1 else None
+
+
+def run_job(job_id, attempt, chunk_size=JOB_CHUNK_SIZE):
+    """
+    Runs a claimed job from its last committed chunk to the end
+    """
+    job = db.session.get(Job, job_id)
+    name = job.job_kind
+    kind = JOB_KINDS[name]
+    items = json.loads(job.job_params)
+    summary = json.loads(job.job_result) if job.job_result else {}
+    owned = and_(Job.job_id == job_id, Job.job_attempts == attempt)
+
+    try:
+        for offset in range(job.job_done, len(items), chunk_size):
+            chunk = items[offset:offset + chunk_size]
+            part, mov_ids, act_ids = kind.run(chunk, offset)
+            summary = merge_summary(summary, part)
+            progress = db.session.execute(update(Job).where(owned).values(
+                job_done=offset + len(chunk), job_result=json.dumps(summary), job_heartbeat=utcnow()))
+            if progress.rowcount != 1:
+                # Taken over by another worker, drop this chunk
+                db.session.rollback()
+                logger.warning("Job %s was taken over by another worker", job_id)
+                return
+            db.session.commit()
+            response_cache.invalidate(movie_ids=mov_ids, actor_ids=act_ids)
+            costar_graph.casts_changed(movie_ids=mov_ids, actor_ids=act_ids)
+
+        db.session.execute(update(Job).where(owned).values(job_status='done', job_finished=utcnow()))
+        db.session.commit()
+        logger.info("Job %s (%s) done: %s items", job_id, name, len(items))
+
+    except SQLAlchemyError as err_job:
+        db.session.rollback()
+        logger.error("Job %s (%s) failed: %s", job_id, name, err_job)
+        db.session.execute(update(Job).where(owned).values(
+            job_status='failed', job_finished=utcnow(), job_error="Database error"))
+        db.session.commit()
+
+
+class JobWorker:
+    """
+    Threads that poll the jobs table and run the jobs. enqueue() wakes them,
+    so a job queued by this process starts without waiting for the next poll.
+    """
+
+    def __init__(self, threads=JOB_WORKER_THREADS, poll_interval=JOB_POLL_INTERVAL):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        if JOB_WORKER == "thread":
+            start_in_serving_process(app, lambda: self.start(app))
+
+    def start(self, app):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for number in range(self.threads):
+                threading.Thread(target=self.run_forever, args=(app,), name=f"job-worker-{number}", daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def run_next(self, app):
+        """
+        Claims and runs one job, returns False when there was none
+        """
+        with app.app_context():
+            claimed = claim_job()
+            if claimed is None:
+                return False
+            run_job(*claimed)
+            return True
+
+    def run_forever(self, app):
+        while True:
+            try:
+                if self.run_next(app):
+                    continue
+                wait = self.poll_interval
+            except SQLAlchemyError as err_worker:
+                logger.warning("Job worker: %s", err_worker)
+                wait = self.poll_interval * 10
+            except Exception:
+                # Keep the thread alive, the job is taken over once it is stale
+                logger.exception("Job worker error")
+                wait = self.poll_interval
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+job_worker = JobWorker()
+
+
+@click.command('run-jobs')
+@click.option('--once', is_flag=True, help='Run the queued jobs and exit.')
+@with_appcontext
+def run_jobs_command(once):
+    """Run background jobs (for JOB_WORKER=none)."""
+    app = current_app._get_current_object()
+    if once:
+        count = 0
+        while job_worker.run_next(app):
+            count += 1
+        click.echo(f"{count} jobs run")
+        return
+    click.echo("Waiting for jobs ...")
+    job_worker.run_forever(app)
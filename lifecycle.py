@@ -0,0 +1,27 @@
+import os
+import threading
+
+# Background work (the job worker threads, the co-star graph build) starts at
+# the first request a process serves, not in create_app: the app is also
+# created in the gunicorn master, whose threads don't survive the fork of the
+# workers, and by CLI commands (flask db, flask run-jobs), which serve no
+# requests and shouldn't start threads or load data.
+
+
+def start_in_serving_process(app, start):
+    """
+    Calls start() once in every process that serves requests of the app, at its first request
+    """
+    started = {"pid": None}
+    lock = threading.Lock()
+
+    def start_once():
+        if started["pid"] == os.getpid():
+            return
+        with lock:
+            if started["pid"] == os.getpid():
+                return
+            started["pid"] = os.getpid()
+        start()
+
+    app.before_request(start_once)
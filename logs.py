@@ -0,0 +1,150 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from os import environ as env
+
+from flask import request, has_request_context
+
+# Structured, non-blocking logging.
+# setup_logging() puts a QueueHandler on the root logger: a log call only
+# formats the record and puts it on a queue, a QueueListener thread writes it
+# to stdout. Records are redacted (tokens, secrets, database passwords) before
+# they are queued, DEBUG records are sampled.
+# Modules log through logging.getLogger(__name__).
+
+LOG_LEVEL = env.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = env.get("LOG_FORMAT", "json")
+LOG_DEBUG_SAMPLE_RATE = float(env.get("LOG_DEBUG_SAMPLE_RATE", 0.1))
+
+REDACTED = "[REDACTED]"
+REDACT_PATTERNS = (
+    # Bearer tokens in headers
+    (re.compile(r"(?i)(bearer\s+)[\w\-.~+/]+=*"), r"\1" + REDACTED),
+    # JWTs anywhere (header.payload.signature)
+    (re.compile(r"eyJ[\w-]*\.[\w-]+\.[\w-]*"), REDACTED),
+    # Token and secret values in dicts, JSON and query strings
+    (re.compile(r"""(?i)(["']?(?:access_token|id_token|refresh_token|client_secret|secret_key|password)["']?\s*[:=]\s*["']?)[^"',&\s}]+"""),
+     r"\1" + REDACTED),
+    # Password in database URLs
+    (re.compile(r"(://[^:/@\s]+:)[^@\s]+@"), r"\1" + REDACTED + "@"),
+)
+
+
+def redact(text):
+    for pattern, replacement in REDACT_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class RedactFilter(logging.Filter):
+    """
+    Merges the message arguments and redacts the result
+    """
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Lets through only a share (`rate`) of the DEBUG records
+    """
+
+    def __init__(self, rate=LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds the method and path of the current request, while it is still known
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("method", "path"):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+_setup_lock = threading.Lock()
+_listener = None
+
+
+def _make_listener(log_queue, log_format):
+    handler = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    return QueueListener(log_queue, handler, respect_handler_level=True)
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE):
+    """
+    Installs the queue handler on the root logger and starts the writer
+    thread, once per process
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        log_queue = queue.SimpleQueue()
+        handler = QueueHandler(log_queue)
+        handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+        handler.addFilter(RequestContextFilter())
+        handler.addFilter(RedactFilter())
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(handler)
+
+        _listener = _make_listener(log_queue, log_format)
+        _listener.start()
+        atexit.register(_stop_listener)
+
+        # A forked worker (e.g. gunicorn --preload) doesn't inherit the writer thread
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=lambda: _restart_listener(log_queue, log_format))
+
+
+def _restart_listener(log_queue, log_format):
+    global _listener
+    _listener = _make_listener(log_queue, log_format)
+    _listener.start()
+
+
+def _stop_listener():
+    # Writes the records that are still queued
+    if _listener is not None:
+        _listener.stop()
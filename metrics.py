@@ -0,0 +1,177 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from os import environ as env
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request performance instrumentation.
+# RequestMetrics times every request, counts its SQL statements (engine events)
+# and collects the timings of named steps such as auth (see track()). The
+# results are sent back as a Server-Timing header and aggregated per endpoint
+# into histograms, served in the Prometheus text format at /metrics.
+# The numbers are per process, every worker reports its own.
+
+SERVER_TIMING = env.get("SERVER_TIMING", "true").lower() == "true"
+METRICS_BUCKETS = tuple(sorted(
+    float(bound) for bound in env.get(
+        "METRICS_BUCKETS", "0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",")))
+
+
+def _label_text(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Counter:
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{{{_label_text(self.label_names, labels)}}} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative histogram per label set, in seconds
+    """
+
+    def __init__(self, name, description, label_names, buckets=METRICS_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [count per bucket (not cumulative), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                label_text = _label_text(self.label_names, labels)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {round(total, 6)}")
+                lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+@contextmanager
+def track(name):
+    """
+    Adds the duration of the block to the timing `name` of the current request
+    """
+    if not has_request_context() or "request_timings" not in g:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = g.request_timings
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class RequestMetrics:
+    def __init__(self, server_timing=SERVER_TIMING):
+        self.server_timing = server_timing
+        self.requests = Counter(
+            "http_requests_total", "Requests by endpoint, method and status.", ("endpoint", "method", "status"))
+        self.request_duration = Histogram(
+            "http_request_duration_seconds", "Wall time of a request.", ("endpoint", "method"))
+        self.db_statements = Counter(
+            "db_statements_total", "SQL statements executed by requests.", ("endpoint",))
+        self.db_duration = Histogram(
+            "db_duration_seconds", "Time per request spent executing SQL.", ("endpoint",))
+        self.auth_duration = Histogram(
+            "auth_duration_seconds", "Time per request spent in requires_auth.", ("endpoint",))
+        self._engine_events = False
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if not self._engine_events:
+            # Every engine (primary and replicas)
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._engine_events = True
+
+    @staticmethod
+    def _before_request():
+        g.request_started = time.perf_counter()
+        g.request_timings = {}
+        g.sql_count = 0
+        g.sql_time = 0.0
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and has_request_context() and "sql_count" in g:
+            context._metrics_started = time.perf_counter()
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None and has_request_context() and "sql_count" in g:
+            g.sql_count += 1
+            g.sql_time += time.perf_counter() - started
+
+    def _after_request(self, response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        timings = g.request_timings
+        endpoint = request.endpoint or "unmatched"
+
+        self.requests.inc((endpoint, request.method, str(response.status_code)))
+        self.request_duration.observe((endpoint, request.method), duration)
+        self.db_statements.inc((endpoint,), g.sql_count)
+        self.db_duration.observe((endpoint,), g.sql_time)
+        if "auth" in timings:
+            self.auth_duration.observe((endpoint,), timings["auth"])
+
+        if self.server_timing:
+            # Durations in milliseconds
+            entries = [f"app;dur={duration * 1000:.2f}", f'db;dur={g.sql_time * 1000:.2f};desc="statements: {g.sql_count}"']
+            entries += [f"{name};dur={value * 1000:.2f}" for name, value in timings.items()]
+            response.headers.add("Server-Timing", ", ".join(entries))
+        return response
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.request_duration, self.db_statements, self.db_duration, self.auth_duration):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
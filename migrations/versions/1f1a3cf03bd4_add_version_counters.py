@@ -0,0 +1,28 @@
+"""add version counters
+
+Revision ID: 1f1a3cf03bd4
+Revises: 5cf058b21f20
+Create Date: 2026-10-18 11:40:07.519342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f1a3cf03bd4'
+down_revision = '5cf058b21f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('movies', sa.Column('mov_version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('actors', sa.Column('act_version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('casts', sa.Column('cas_version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('casts', 'cas_version')
+    op.drop_column('actors', 'act_version')
+    op.drop_column('movies', 'mov_version')
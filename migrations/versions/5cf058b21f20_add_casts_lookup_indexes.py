@@ -0,0 +1,26 @@
+"""add casts lookup indexes
+
+Revision ID: 5cf058b21f20
+Revises: e61eb0e41794
+Create Date: 2026-10-18 09:12:31.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5cf058b21f20'
+down_revision = 'e61eb0e41794'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lookups by act_id (actor portfolio, actor delete) cannot use the
+    # (mov_id, act_id, cas_role) unique constraint, which leads with mov_id.
+    op.create_index('ix_casts_act_id_mov_id', 'casts', ['act_id', 'mov_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_casts_act_id_mov_id', table_name='casts')
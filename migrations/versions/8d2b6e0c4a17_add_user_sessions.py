@@ -0,0 +1,31 @@
+"""add user sessions
+
+Revision ID: 8d2b6e0c4a17
+Revises: 1f1a3cf03bd4
+Create Date: 2026-10-18 20:32:51.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2b6e0c4a17'
+down_revision = '1f1a3cf03bd4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_sessions',
+    sa.Column('ses_id', sa.String(length=64), nullable=False),
+    sa.Column('ses_data', sa.Text(), nullable=False),
+    sa.Column('ses_expires', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('ses_id')
+    )
+    op.create_index(op.f('ix_user_sessions_ses_expires'), 'user_sessions', ['ses_expires'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_sessions_ses_expires'), table_name='user_sessions')
+    op.drop_table('user_sessions')
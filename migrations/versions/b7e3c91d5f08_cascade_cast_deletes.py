@@ -0,0 +1,37 @@
+"""cascade cast deletes
+
+Revision ID: b7e3c91d5f08
+Revises: 8d2b6e0c4a17
+Create Date: 2026-10-18 20:14:03.551290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c91d5f08'
+down_revision = '8d2b6e0c4a17'
+branch_labels = None
+depends_on = None
+
+# The initial migration created the foreign keys unnamed. These are the names
+# PostgreSQL gave them; on SQLite the convention names the reflected ones the
+# same, so batch mode can drop them while it recreates the table.
+naming_convention = {"fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+
+def upgrade():
+    with op.batch_alter_table('casts', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('casts_mov_id_fkey', type_='foreignkey')
+        batch_op.drop_constraint('casts_act_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key('casts_mov_id_fkey', 'movies', ['mov_id'], ['mov_id'], ondelete='CASCADE')
+        batch_op.create_foreign_key('casts_act_id_fkey', 'actors', ['act_id'], ['act_id'], ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('casts', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('casts_act_id_fkey', type_='foreignkey')
+        batch_op.drop_constraint('casts_mov_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key('casts_act_id_fkey', 'actors', ['act_id'], ['act_id'])
+        batch_op.create_foreign_key('casts_mov_id_fkey', 'movies', ['mov_id'], ['mov_id'])
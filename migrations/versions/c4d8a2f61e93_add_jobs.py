@@ -0,0 +1,40 @@
+"""add jobs
+
+Revision ID: c4d8a2f61e93
+Revises: b7e3c91d5f08
+Create Date: 2026-10-18 21:47:12.318604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8a2f61e93'
+down_revision = 'b7e3c91d5f08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('job_id', sa.String(length=32), nullable=False),
+    sa.Column('job_kind', sa.String(length=32), nullable=False),
+    sa.Column('job_status', sa.String(length=16), nullable=False),
+    sa.Column('job_params', sa.Text(), nullable=False),
+    sa.Column('job_total', sa.Integer(), nullable=False),
+    sa.Column('job_done', sa.Integer(), nullable=False),
+    sa.Column('job_result', sa.Text(), nullable=True),
+    sa.Column('job_error', sa.String(length=255), nullable=True),
+    sa.Column('job_attempts', sa.Integer(), nullable=False),
+    sa.Column('job_created', sa.DateTime(), nullable=False),
+    sa.Column('job_heartbeat', sa.DateTime(), nullable=True),
+    sa.Column('job_finished', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('job_id')
+    )
+    op.create_index(op.f('ix_jobs_job_status'), 'jobs', ['job_status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_jobs_job_status'), table_name='jobs')
+    op.drop_table('jobs')
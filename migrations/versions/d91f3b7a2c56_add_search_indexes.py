@@ -0,0 +1,35 @@
+"""add search indexes
+
+Revision ID: d91f3b7a2c56
+Revises: c4d8a2f61e93
+Create Date: 2026-10-18 22:35:40.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f3b7a2c56'
+down_revision = 'c4d8a2f61e93'
+branch_labels = None
+depends_on = None
+
+
+def search_key(expression):
+    # Same expression as model.search_key, byte order on PostgreSQL so a prefix is an index range
+    if op.get_bind().dialect.name == 'postgresql':
+        return sa.text(f'lower({expression}) COLLATE "C"')
+    return sa.text(f'lower({expression})')
+
+
+def upgrade():
+    op.create_index('ix_movies_title_search', 'movies', [search_key('mov_title'), 'mov_id'], unique=False)
+    op.create_index('ix_actors_name_search', 'actors', [search_key("act_firstname || ' ' || act_lastname"), 'act_id'], unique=False)
+    op.create_index('ix_actors_lastname_search', 'actors', [search_key('act_lastname'), 'act_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_actors_lastname_search', table_name='actors')
+    op.drop_index('ix_actors_name_search', table_name='actors')
+    op.drop_index('ix_movies_title_search', table_name='movies')
@@ -1,20 +1,83 @@
 from os import environ as env
+import logging
+import sqlite3
+import string
+import click
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import UniqueConstraint, CheckConstraint
+from sqlalchemy import MetaData, UniqueConstraint, CheckConstraint, String, and_, event, literal_column, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 
-db = SQLAlchemy()
+from routing import RoutingSession
+from serializers import cast_member_serializer, portfolio_serializer
+
+# Foreign keys get the names PostgreSQL gives unnamed ones, so migrations can
+# refer to them on every database (SQLite doesn't name them itself)
+NAMING_CONVENTION = {"ix": "ix_%(column_0_label)s", "fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+db = SQLAlchemy(metadata=MetaData(naming_convention=NAMING_CONVENTION),
+                session_options={"class_": RoutingSession})
+
+logger = logging.getLogger(__name__)
+
+# SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked to, per connection
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+# Default and maximum number of search results
+SEARCH_LIMIT = int(env.get("SEARCH_LIMIT", 10))
+SEARCH_MAX_LIMIT = 50
+# Sorts after every character, the end of a prefix range
+SEARCH_KEY_MAX = '\U0010ffff'
+# lower() of SQLite only folds A-Z
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
 
 database_path = env.get("DATABASE_URL")
 if database_path.startswith("postgres://"):
   database_path = database_path.replace("postgres://", "postgresql://", 1)
 
 def setup_db(app, database_path=database_path):
+    # A database URI from the app config (e.g. TestingConfig) takes precedence
+    database_path = app.config.get("SQLALCHEMY_DATABASE_URI") or database_path
+    if database_path.startswith("postgres://"):
+        database_path = database_path.replace("postgres://", "postgresql://", 1)
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
+    # The schema is not created here, so starting the app doesn't touch the
+    # database. Run `flask db upgrade` (migrations) or `flask init-db` once.
+
+class search_key(FunctionElement):
+    """
+    lower(<expression>), compared byte by byte (COLLATE "C" on PostgreSQL), so
+    the names starting with a prefix are one range of an index on the key.
+    """
+    type = String()
+    name = 'search_key'
+    inherit_cache = True
+
+
+@compiles(search_key)
+def compile_search_key(element, compiler, **kw):
+    return "lower(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(search_key, 'postgresql')
+def compile_search_key_postgresql(element, compiler, **kw):
+    return 'lower(%s) COLLATE "C"' % compiler.process(element.clauses, **kw)
+
+
+def actor_name(first, last):
+    # The space is a literal, so queries match the index expression
+    return first + literal_column("' '") + last
 
 class Movie(db.Model):
     """
@@ -27,8 +90,14 @@ class Movie(db.Model):
     mov_title = db.Column(db.String(30), nullable=False)
     mov_release = db.Column(db.Integer, CheckConstraint('mov_release >= 1920 AND mov_release <= 2030'), nullable=True)
     mov_language = db.Column(db.String(2), nullable=True)
+    # Change counter of the movie and its cast, used as ETag
+    mov_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
-    __table_args__ = (UniqueConstraint('mov_id', 'mov_title', 'mov_release'),)
+    __table_args__ = (
+        UniqueConstraint('mov_id', 'mov_title', 'mov_release'),
+        # Prefix search on the title
+        db.Index('ix_movies_title_search', search_key(mov_title), mov_id),
+    )
     
     def __repr__(self):
         return f'<Movie {self.mov_id} {self.mov_title} {self.mov_release} {self.mov_language}>'
@@ -45,6 +114,14 @@ class Actor(db.Model):
     act_lastname = db.Column(db.String(25), nullable=False)
     act_language = db.Column(db.String(2), nullable=True)
     act_gender = db.Column(db.String(6), nullable=True)
+    # Change counter of the actor and its portfolio, used as ETag
+    act_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __table_args__ = (
+        # Prefix search on "first last" and on the last name
+        db.Index('ix_actors_name_search', search_key(actor_name(act_firstname, act_lastname)), act_id),
+        db.Index('ix_actors_lastname_search', search_key(act_lastname), act_id),
+    )
 
     def __repr__(self):
         return f'<Actor {self.act_id} {self.act_firstname} {self.act_lastname} {self.act_language} {self.act_gender}>'
@@ -58,58 +135,216 @@ class Cast(db.Model):
 
     __tablename__ = 'casts'
     cas_id = db.Column(db.Integer, autoincrement=True, primary_key=True)
-    mov_id = db.Column(db.Integer, db.ForeignKey('movies.mov_id'), nullable=False)
-    act_id = db.Column(db.Integer, db.ForeignKey('actors.act_id'), nullable=False)
+    # The database removes the casts of a deleted movie or actor
+    mov_id = db.Column(db.Integer, db.ForeignKey('movies.mov_id', ondelete='CASCADE'), nullable=False)
+    act_id = db.Column(db.Integer, db.ForeignKey('actors.act_id', ondelete='CASCADE'), nullable=False)
     cas_role = db.Column(db.String(35), nullable=True)
+    # Bumped by the ORM on every update of the cast entry
+    cas_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Amake sure the relation is unique, to enable consistant deleting movies.
-    __table_args__ = (UniqueConstraint('mov_id', 'act_id', 'cas_role'),)
+    # The unique constraint also serves the lookups by mov_id (and mov_id + act_id),
+    # the extra index serves the lookups by act_id (portfolio, actor delete).
+    __table_args__ = (
+        UniqueConstraint('mov_id', 'act_id', 'cas_role'),
+        db.Index('ix_casts_act_id_mov_id', 'act_id', 'mov_id'),
+    )
 
-    movie = db.relationship('Movie', backref=db.backref('casts', lazy=True))
-    actor = db.relationship('Actor', backref=db.backref('casts', lazy=True))
+    # Loaded on access only; a query that serializes the movie or actor of
+    # many casts loads them with selectinload/joinedload (the cast lists and
+    # portfolios are single join queries and don't use these).
+    # passive_deletes: deleting a movie or actor doesn't load its casts, the
+    # foreign keys cascade the delete.
+    movie = db.relationship('Movie', backref=db.backref(
+        'casts', lazy=True, cascade='all, delete-orphan', passive_deletes=True))
+    actor = db.relationship('Actor', backref=db.backref(
+        'casts', lazy=True, cascade='all, delete-orphan', passive_deletes=True))
+
+    __mapper_args__ = {'version_id_col': cas_version}
 
     def __repr__(self):
         return f'<Cast {self.cas_id} {self.mov_id} {self.act_id} {self.cas_role}>'
 
+class UserSession(db.Model):
+    """
+    Represents a server-side login session (SESSION_BACKEND=sql).
+    The session cookie only holds the ses_id.
+
+    """
+
+    __tablename__ = 'user_sessions'
+    ses_id = db.Column(db.String(64), primary_key=True)
+    ses_data = db.Column(db.Text, nullable=False)
+    ses_expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<UserSession {self.ses_id} {self.ses_expires}>'
+
+class Job(db.Model):
+    """
+    Represents a background job (see jobs.py): a bulk operation queued by an
+    endpoint and run by a worker. job_done counts the items committed so far,
+    job_result holds the summary of those items as JSON.
+
+    """
+
+    __tablename__ = 'jobs'
+    job_id = db.Column(db.String(32), primary_key=True)
+    job_kind = db.Column(db.String(32), nullable=False)
+    job_status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    job_params = db.Column(db.Text, nullable=False)
+    job_total = db.Column(db.Integer, nullable=False, default=0)
+    job_done = db.Column(db.Integer, nullable=False, default=0)
+    job_result = db.Column(db.Text, nullable=True)
+    job_error = db.Column(db.String(255), nullable=True)
+    job_attempts = db.Column(db.Integer, nullable=False, default=0)
+    job_created = db.Column(db.DateTime, nullable=False)
+    job_heartbeat = db.Column(db.DateTime, nullable=True)
+    job_finished = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.job_id} {self.job_kind} {self.job_status}>'
+
 def create_tables():
-    with db.app.app.context():
-        db.create_all()
+    # Only the primary database, replicas get the schema through replication
+    with db.app.app_context():
+        db.create_all(bind_key=None)
 
-# Get all movie casts where selected actor was part of.
-def queryCastByActor(act_id):
-    try:
-        actor = Actor.query.get(act_id)
-
-        if actor:
-            # Use actor.casts to get the list of movies they have acted in
-            casts = [
-                {"title": cast.movie.mov_title, "role": cast.cas_role}
-                for cast in actor.casts
-            ]
-            return casts
-        else:
-            return None  # Return None if actor not found
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the tables that don't exist yet on the primary database."""
+    db.create_all(bind_key=None)
+    click.echo("Database tables created.")
+
+# Get one page of records ordered by their primary key (keyset pagination).
+# Returns the records and the key to continue after, None on the last page.
+def queryPage(model, key, after=None, limit=50):
+    query = model.query.order_by(key)
+    if after is not None:
+        query = query.filter(key > after)
+
+    # Fetch one extra record to find out whether there is a next page
+    records = query.limit(limit + 1).all()
+    if len(records) > limit:
+        records = records[:limit]
+        return records, getattr(records[-1], key.key)
+    return records, None
+
+
+def queryMoviePage(after=None, limit=50):
+    return queryPage(Movie, Movie.mov_id, after, limit)
+
+
+def queryActorPage(after=None, limit=50):
+    return queryPage(Actor, Actor.act_id, after, limit)
+
+
+# Case-insensitive prefix search (autocomplete). A prefix is a range of a
+# search_key index, read in index order up to the limit. The prefix is lowered
+# the way the database lowers the key: on SQLite only A-Z, so there the search
+# ignores the case of ASCII letters only ("É" finds "Émile", "é" doesn't).
+def prefixRange(key, prefix):
+    if db.engine.dialect.name == 'sqlite':
+        prefix = prefix.translate(ASCII_LOWER)
+    else:
+        prefix = prefix.lower()
+    return and_(key >= prefix, key < prefix + SEARCH_KEY_MAX)
+
+
+# Movies whose title starts with the prefix, by title.
+def querySearchMovies(prefix, limit=SEARCH_LIMIT):
+    key = search_key(Movie.mov_title)
+    return Movie.query.filter(prefixRange(key, prefix)).order_by(key, Movie.mov_id).limit(limit).all()
+
+
+# Actors whose full name ("first last", so also the first name) or last name
+# starts with the prefix. One range scan per index; full name matches first.
+def querySearchActors(prefix, limit=SEARCH_LIMIT):
+    actors = {}
+    for key in (search_key(actor_name(Actor.act_firstname, Actor.act_lastname)), search_key(Actor.act_lastname)):
+        for actor in Actor.query.filter(prefixRange(key, prefix)).order_by(key, Actor.act_id).limit(limit):
+            actors.setdefault(actor.act_id, actor)
+    return list(actors.values())[:limit]
+
+
+# Bump the change counters of movies whose cast changed and actors whose
+# portfolio changed, in the current transaction.
+def touchVersions(movie_ids=(), actor_ids=()):
+    movie_ids = set(movie_ids)
+    actor_ids = set(actor_ids)
+    if movie_ids:
+        db.session.execute(update(Movie).where(Movie.mov_id.in_(movie_ids)).values(mov_version=Movie.mov_version + 1))
+    if actor_ids:
+        db.session.execute(update(Actor).where(Actor.act_id.in_(actor_ids)).values(act_version=Actor.act_version + 1))
+
+
+# Current change counter of a movie, None if the movie does not exist.
+def queryMovieVersion(mov_id):
+    return db.session.query(Movie.mov_version).filter(Movie.mov_id == mov_id).scalar()
 
-    except SQLAlchemyError as act_retrieve_error:
-        print(str(act_retrieve_error))
-        return None
 
+# Current change counter of an actor, None if the actor does not exist.
+def queryActorVersion(act_id):
+    return db.session.query(Actor.act_version).filter(Actor.act_id == act_id).scalar()
 
-# Get all movies where selected actor performed in.
-def queryMovieByActor(act_id):
+
+# Movies and actors by id, in one query each. Ids that don't exist are left out.
+def queryMoviesByIds(mov_ids):
+    return {movie.mov_id: movie for movie in Movie.query.filter(Movie.mov_id.in_(set(mov_ids)))}
+
+
+def queryActorsByIds(act_ids):
+    return {actor.act_id: actor for actor in Actor.query.filter(Actor.act_id.in_(set(act_ids)))}
+
+
+# Ids of the actors in the cast of a movie.
+def queryActorIdsByMovie(mov_id):
+    return [act_id for (act_id,) in db.session.query(Cast.act_id).filter(Cast.mov_id == mov_id).distinct()]
+
+
+# Get the cast (actors and roles) of a movie in a single query.
+# Database errors are left to the caller.
+def queryCastByMovie(mov_id):
+    return queryCastByMovies([mov_id]).get(mov_id)  # None if movie not found
+
+
+# Get the casts of many movies in a single query (IN), grouped by mov_id.
+# Movies that don't exist are left out. Database errors are left to the caller.
+def queryCastByMovies(mov_ids):
+    # Outer join, so a movie without cast still returns one (empty) row
+    rows = db.session.query(
+        Movie.mov_id, Actor.act_id, Actor.act_firstname, Actor.act_lastname, Cast.cas_role
+    ).outerjoin(Cast, Cast.mov_id == Movie.mov_id
+    ).outerjoin(Actor, Actor.act_id == Cast.act_id
+    ).filter(Movie.mov_id.in_(set(mov_ids))
+    ).order_by(Movie.mov_id, Cast.cas_id).all()
+
+    casts = {}
+    for row in rows:
+        members = casts.setdefault(row.mov_id, [])
+        if row.act_id is not None:
+            members.append(row)
+    return {mov_id: cast_member_serializer.dump_many(members) for mov_id, members in casts.items()}
+
+
+# Get the portfolio (movie titles and roles) of an actor in a single query.
+def queryPortfolioByActor(act_id):
     try:
-        actor = Actor.query.get(act_id)
-
-        if actor:
-            # Use actor.casts to get the list of movies they have acted in
-            movies = [
-                {"title": cast.movie.mov_title, "role": cast.cas_role}
-                for cast in actor.casts
-            ]
-            return movies
-        else:
+        # Outer join, so an actor without casts still returns one (empty) row
+        rows = db.session.query(
+            Actor.act_id, Movie.mov_title.label('title'), Cast.cas_role.label('role')
+        ).outerjoin(Cast, Cast.act_id == Actor.act_id
+        ).outerjoin(Movie, Movie.mov_id == Cast.mov_id
+        ).filter(Actor.act_id == act_id
+        ).order_by(Cast.cas_id).all()
+
+        if not rows:
             return None  # Return None if actor not found
 
+        return portfolio_serializer.dump_many(row for row in rows if row.title is not None)
+
     except SQLAlchemyError as act_retrieve_error:
-        print(str(act_retrieve_error))
-        return None
\ No newline at end of file
+        logger.error("Failed to retrieve portfolio: %s", act_retrieve_error)
+        return None
+
@@ -0,0 +1,51 @@
+import json
+import base64
+import binascii
+from os import environ as env
+
+from flask import request
+
+# Keyset (seek) pagination helpers.
+# A page is selected by the id of the last record of the previous page, which
+# is handed to the client as an opaque cursor token.
+
+PAGE_SIZE = int(env.get("PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(env.get("MAX_PAGE_SIZE", 500))
+
+
+def encode_cursor(last_id):
+    """
+    Encodes the id of the last record of a page into an opaque cursor token
+    """
+    if last_id is None:
+        return None
+    raw = json.dumps({"after": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Returns the id encoded in a cursor token, raises ValueError if the token is invalid
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        after = json.loads(raw)["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(after, int):
+        raise ValueError("Invalid cursor")
+    return after
+
+
+def page_args(prefix=""):
+    """
+    Reads the `limit` and `cursor` query parameters (optionally prefixed) of
+    the current request. Raises ValueError on invalid values.
+    """
+    limit = request.args.get(prefix + "limit", PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise ValueError("Invalid limit")
+    after = decode_cursor(request.args.get(prefix + "cursor"))
+    return after, min(limit, MAX_PAGE_SIZE)
@@ -0,0 +1,184 @@
+import math
+import time
+import logging
+import itertools
+import threading
+from functools import wraps
+from os import environ as env
+
+from flask import g, request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+# Read-replica routing.
+# Replicas are configured as SQLALCHEMY_BINDS named replica_<n>. Statements of
+# handlers marked with @read_only are sent to a healthy replica, everything
+# else (writes, reads after a write, CLI commands) goes to the primary.
+# A request that wrote sets a short-lived cookie on its response; while the
+# client sends it back, its reads go to the primary whichever worker serves
+# them, so the client reads its own writes despite replication lag. Other
+# clients keep reading from the replicas.
+
+REPLICA_BIND_PREFIX = "replica_"
+REPLICA_HEALTH_INTERVAL = float(env.get("REPLICA_HEALTH_INTERVAL", 10))
+REPLICA_STICKY_SECONDS = float(env.get("REPLICA_STICKY_SECONDS", 2))
+REPLICA_STICKY_COOKIE = env.get("REPLICA_STICKY_COOKIE", "db_primary_until")
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """
+    Picks a replica engine round robin, skipping replicas that failed their
+    last health check. A client that wrote reads from the primary for
+    REPLICA_STICKY_SECONDS (see primary_pinned).
+    """
+
+    def __init__(self, health_interval=REPLICA_HEALTH_INTERVAL, sticky_seconds=REPLICA_STICKY_SECONDS):
+        self.health_interval = health_interval
+        self.sticky_seconds = sticky_seconds
+        self._counter = itertools.count()
+        self._health = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def replica_keys(engines):
+        return sorted(key for key in engines if key and key.startswith(REPLICA_BIND_PREFIX))
+
+    def init_app(self, app, db):
+        # Take a replica out of rotation as soon as it drops a connection
+        with app.app_context():
+            for key in self.replica_keys(db.engines):
+                event.listen(db.engines[key], "handle_error", self._error_listener(key))
+        app.after_request(self._sticky_cookie)
+
+    def _error_listener(self, key):
+        def handle_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                self.mark_unhealthy(key)
+        return handle_error
+
+    def choose(self, engines):
+        """
+        Returns the engine of a healthy replica, or None to use the primary
+        """
+        keys = self.replica_keys(engines)
+        if not keys:
+            return None
+        start = next(self._counter)
+        for offset in range(len(keys)):
+            key = keys[(start + offset) % len(keys)]
+            if self.is_healthy(key, engines[key]):
+                return engines[key]
+        return None
+
+    def is_healthy(self, key, engine):
+        healthy, checked_at = self._health.get(key, (None, 0.0))
+        now = time.monotonic()
+        if healthy is None or now - checked_at > self.health_interval:
+            healthy = self._check(engine)
+            with self._lock:
+                self._health[key] = (healthy, now)
+        return healthy
+
+    @staticmethod
+    def _check(engine):
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return True
+        except Exception as err_replica:
+            logger.warning("Replica unavailable: %s", err_replica)
+            return False
+
+    def mark_unhealthy(self, key):
+        with self._lock:
+            self._health[key] = (False, time.monotonic())
+
+    def mark_write(self):
+        """
+        Pins the rest of the current request, and the client's next requests, to the primary
+        """
+        g.db_wrote = True
+
+    def primary_pinned(self):
+        """
+        True when the current request or, going by its cookie, a recent
+        request of the same client wrote
+        """
+        if g.get("db_wrote"):
+            return True
+        try:
+            # Wall clock, the cookie may come back to another worker or host
+            return float(request.cookies.get(REPLICA_STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _sticky_cookie(self, response):
+        if g.get("db_wrote") and self.sticky_seconds > 0:
+            response.set_cookie(REPLICA_STICKY_COOKIE, f"{time.time() + self.sticky_seconds:.3f}",
+                                max_age=math.ceil(self.sticky_seconds), httponly=True, samesite="Lax")
+        return response
+
+    def status(self, engines):
+        return {
+            key: self._health.get(key, (None, 0.0))[0]
+            for key in self.replica_keys(engines)
+        }
+
+
+replica_router = ReplicaRouter()
+
+
+def read_only(f):
+    """
+    Marks a request handler as read-only, so its queries may be served by a replica
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+class RoutingSession(Session):
+    """
+    Session that sends the reads of read-only handlers to a replica, as long
+    as neither the session nor, recently, the client has written anything.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not self.info.get("wrote")
+                and has_request_context() and g.get("db_read_only") and not replica_router.primary_pinned()):
+            # One replica for the whole request, so all its reads (e.g. a
+            # version and the rows it versions) come from the same database
+            if "db_replica" not in g:
+                g.db_replica = replica_router.choose(self._db.engines)
+            if g.db_replica is not None:
+                return g.db_replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_dml(orm_execute_state):
+    # Core/ORM insert, update and delete statements bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    if session.info.pop("wrote", False) and has_request_context():
+        replica_router.mark_write()
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("wrote", None)
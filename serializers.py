@@ -0,0 +1,117 @@
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+# Optional dependency, the standard library encoder is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response serialization.
+# FastJSONProvider encodes the responses of jsonify with orjson when it is
+# installed. The serializers turn model instances and query rows into dicts
+# with a fixed field order, optionally reduced to a sparse fieldset (?fields=).
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that uses orjson for encoding and decoding when available.
+    Without orjson, or for options orjson doesn't support, it falls back to
+    Flask's default provider.
+    """
+
+    def _orjson_option(self, kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.pop("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        indent = kwargs.pop("indent", None)
+        if indent is not None:
+            if indent != 2:
+                return None
+            option |= orjson.OPT_INDENT_2
+        kwargs.pop("ensure_ascii", None)
+        kwargs.pop("separators", None)
+        return option if not kwargs else None
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            option = self._orjson_option(dict(kwargs))
+            if option is not None:
+                try:
+                    return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+                except TypeError:
+                    # e.g. integers beyond 64 bit, left to the standard encoder
+                    pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+
+class Serializer:
+    """
+    Turns objects (model instances or query rows) into dicts of the given
+    fields. The attribute getter of every fieldset is built once and reused.
+    Fields listed in omit_none are left out when their value is None.
+    """
+
+    def __init__(self, fields, omit_none=()):
+        self.fields = tuple(fields)
+        self.omit_none = frozenset(omit_none)
+        self._getters = {}
+
+    def parse_fields(self, value):
+        """
+        Fieldset of a comma separated ?fields= parameter, all fields when empty.
+        Raises ValueError for unknown fields.
+        """
+        if not value:
+            return self.fields
+        fields = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown or not fields:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available fields: {', '.join(self.fields)}.")
+        return fields
+
+    def _getter(self, fields):
+        getter = self._getters.get(fields)
+        if getter is None:
+            get = attrgetter(*fields)
+            # attrgetter of a single field returns the value itself, not a tuple
+            getter = get if len(fields) > 1 else (lambda obj: (get(obj),))
+            self._getters[fields] = getter
+        return getter
+
+    def dump(self, obj, fields=None):
+        fields = fields or self.fields
+        record = dict(zip(fields, self._getter(fields)(obj)))
+        for name in self.omit_none.intersection(fields):
+            if record[name] is None:
+                del record[name]
+        return record
+
+    def dump_many(self, objs, fields=None):
+        fields = fields or self.fields
+        getter = self._getter(fields)
+        if not self.omit_none.intersection(fields):
+            return [dict(zip(fields, getter(obj))) for obj in objs]
+        return [self.dump(obj, fields) for obj in objs]
+
+    def pick(self, records, fields=None):
+        """
+        Reduces dicts produced by this serializer (e.g. cached ones) to a fieldset
+        """
+        if not fields or fields == self.fields:
+            return records
+        return [{name: record[name] for name in fields if name in record} for record in records]
+
+
+movie_serializer = Serializer(('mov_id', 'mov_title', 'mov_release', 'mov_language'))
+actor_serializer = Serializer(('act_id', 'act_firstname', 'act_lastname', 'act_language', 'act_gender'))
+cast_serializer = Serializer(('cas_id', 'mov_id', 'act_id', 'cas_role'))
+# Cast list of a movie and portfolio of an actor (rows of a join)
+cast_member_serializer = Serializer(('act_id', 'act_firstname', 'act_lastname', 'cas_role'), omit_none=('cas_role',))
+portfolio_serializer = Serializer(('title', 'role'))
@@ -0,0 +1,261 @@
+import os
+import json
+import stat
+import time
+import logging
+import secrets
+import tempfile
+import threading
+from datetime import datetime, timezone
+from os import environ as env
+
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, select
+from werkzeug.datastructures import CallbackDict
+
+from model import db, UserSession
+
+# Server-side sessions.
+# The session cookie only holds a random session id, the data lives in a
+# session store: files in SESSION_DIR by default, SESSION_BACKEND=sql keeps
+# them in the user_sessions table. The data is only read from the store when
+# a request actually uses the session, API requests never touch it.
+
+SESSION_BACKEND = env.get("SESSION_BACKEND", "filesystem")
+SESSION_DIR = env.get("SESSION_DIR", os.path.join(tempfile.gettempdir(), "casting_sessions"))
+SESSION_PURGE_INTERVAL = int(env.get("SESSION_PURGE_INTERVAL", 3600))
+
+logger = logging.getLogger(__name__)
+
+# Userinfo claims kept in the session after login, the rest of the Auth0
+# token response (access, id and refresh tokens) is not stored
+USERINFO_FIELDS = ("sub", "nickname", "name", "email", "picture")
+
+
+def session_user(token):
+    """
+    The part of an Auth0 token response that is kept in the session
+    """
+    userinfo = token.get("userinfo") or {}
+    return {"userinfo": {key: userinfo[key] for key in USERINFO_FIELDS if key in userinfo}}
+
+
+class FileSessionStore:
+    """
+    One JSON file per session. Expired files are removed when they are read
+    and by purge().
+    """
+
+    def __init__(self, directory=SESSION_DIR):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_directory()
+
+    def _check_directory(self):
+        # The default lives in the shared temp directory: refuse a directory
+        # another user created (or can read or write), it could leak or plant sessions
+        info = os.lstat(self.directory)
+        if not stat.S_ISDIR(info.st_mode):
+            raise RuntimeError(f"Session directory {self.directory} is not a directory")
+        if hasattr(os, "getuid") and info.st_uid != os.getuid():
+            raise RuntimeError(f"Session directory {self.directory} is owned by another user, set SESSION_DIR")
+        if info.st_mode & 0o077:
+            raise RuntimeError(f"Session directory {self.directory} is accessible by other users, it must have mode 0700")
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def get(self, sid):
+        try:
+            with open(self._path(sid), encoding="utf-8") as file:
+                expires, data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if expires < time.time():
+            self.delete(sid)
+            return None
+        return data
+
+    def set(self, sid, data, expires):
+        # Write to a temporary file first, so readers never see a partial session
+        path = self._path(sid)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump([expires.timestamp(), data], file)
+        os.replace(path + ".tmp", path)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+    def purge(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            try:
+                with open(self._path(name), encoding="utf-8") as file:
+                    expires, data = json.load(file)
+            except (OSError, ValueError):
+                continue
+            if expires < now:
+                self.delete(name)
+
+
+class SQLSessionStore:
+    """
+    Sessions in the user_sessions table of the primary database. Uses its own
+    connection, so it is independent of the request's db.session (and never
+    routed to a read replica).
+    """
+
+    def __init__(self, database=db):
+        self.db = database
+        self.table = UserSession.__table__
+
+    def get(self, sid):
+        table = self.table
+        with self.db.engine.connect() as connection:
+            row = connection.execute(
+                select(table.c.ses_data, table.c.ses_expires).where(table.c.ses_id == sid)).first()
+        if row is None or row.ses_expires.replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+            return None
+        return json.loads(row.ses_data)
+
+    def set(self, sid, data, expires):
+        table = self.table
+        values = {"ses_data": json.dumps(data), "ses_expires": expires.replace(tzinfo=None)}
+        with self.db.engine.begin() as connection:
+            updated = connection.execute(table.update().where(table.c.ses_id == sid).values(**values))
+            if not updated.rowcount:
+                connection.execute(table.insert().values(ses_id=sid, **values))
+
+    def delete(self, sid):
+        table = self.table
+        with self.db.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.ses_id == sid))
+
+    def purge(self):
+        table = self.table
+        with self.db.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.ses_expires < datetime.now(timezone.utc).replace(tzinfo=None)))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Session that loads its data from the store on first access
+    """
+
+    def __init__(self, sid, store, new=False):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, on_update=on_update)
+        self.sid = sid
+        self.store = store
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self._loaded = new
+
+    def _load(self):
+        self.accessed = True
+        if not self._loaded:
+            self._loaded = True
+            data = self.store.get(self.sid)
+            if data:
+                dict.update(self, data)
+
+    def regenerate(self):
+        """
+        Moves the session to a new id, e.g. at login against session fixation
+        """
+        self._load()
+        self.store.delete(self.sid)
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+def _lazy(name):
+    method = getattr(CallbackDict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._load()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ("__getitem__", "__contains__", "__iter__", "__len__", "__repr__", "__eq__",
+              "get", "keys", "values", "items", "copy",
+              "__setitem__", "__delitem__", "setdefault", "pop", "popitem", "update", "clear"):
+    setattr(ServerSideSession, _name, _lazy(_name))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Keeps the session data in a store, the cookie only carries the session id
+    """
+
+    def __init__(self, store, purge_interval=SESSION_PURGE_INTERVAL):
+        self.store = store
+        self.purge_interval = purge_interval
+        self._purged_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        # Session ids are generated by token_urlsafe, anything else is not ours
+        if not sid or len(sid) > 64 or not sid.isascii() or not sid.replace("-", "").replace("_", "").isalnum():
+            return ServerSideSession(secrets.token_urlsafe(32), self.store, new=True)
+        return ServerSideSession(sid, self.store)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session.modified:
+            return
+
+        if not dict.__len__(session):
+            self.store.delete(session.sid)
+            if not session.new:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        expires = self.get_expiration_time(app, session)
+        self.store.set(session.sid, dict(session),
+                       expires or datetime.now(timezone.utc) + app.permanent_session_lifetime)
+        response.set_cookie(
+            name, session.sid, expires=expires, httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path, secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app))
+        self._purge()
+
+    def _purge(self):
+        # Drop expired sessions now and then, on the back of a write
+        with self._lock:
+            if time.monotonic() - self._purged_at < self.purge_interval:
+                return
+            self._purged_at = time.monotonic()
+        try:
+            self.store.purge()
+        except Exception as err_session:
+            logger.warning("Session purge failed: %s", err_session)
+
+
+def make_session_interface(name=SESSION_BACKEND):
+    """
+    Session interface for the configured backend, None keeps Flask's cookie session
+    """
+    if name == "sql":
+        return ServerSideSessionInterface(SQLSessionStore())
+    if name == "filesystem":
+        return ServerSideSessionInterface(FileSessionStore())
+    return None
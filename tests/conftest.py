@@ -0,0 +1,81 @@
+"""
+Fixtures for the tests: apps from create_app() against SQLite files in a
+temporary directory, with tokens signed by a local key instead of Auth0
+(see bench/fixtures.py).
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fixtures import LocalAuth
+
+# The app reads its settings from the environment at import time
+WORK_DIR = tempfile.mkdtemp(prefix="casting_tests_")
+auth = LocalAuth(WORK_DIR)
+os.environ.update(auth.environ())
+os.environ.update({
+    "DATABASE_URL": "sqlite:///" + os.path.join(WORK_DIR, "app.db"),
+    "CACHE_BACKEND": "none",
+    "SESSION_BACKEND": "cookie",
+    "JOB_WORKER": "none",
+    "COSTAR_PRELOAD": "false",
+    "SERVER_TIMING": "false",
+    "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+})
+
+
+def sqlite_url(tmp_path, name):
+    return "sqlite:///" + str(tmp_path / f"{name}.db")
+
+
+@pytest.fixture
+def make_app():
+    """
+    Returns a function that creates the app for a primary database URL and
+    optional read replica URLs
+    """
+    from app import create_app
+    from config import TestingConfig, TESTING_POOL, engine_options, replica_binds
+    from model import db
+
+    def make(database_url, replica_urls=()):
+        class Config(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = database_url
+            SQLALCHEMY_ENGINE_OPTIONS = engine_options(database_url, **TESTING_POOL)
+            SQLALCHEMY_BINDS = replica_binds(",".join(replica_urls), **TESTING_POOL)
+
+        app = create_app(Config)
+        with app.app_context():
+            db.create_all(bind_key=None)
+        return app
+
+    return make
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    return make_app(sqlite_url(tmp_path, "primary"))
+
+
+@pytest.fixture
+def client_for():
+    """
+    Returns a function that gives a test client of an app, sending a token with all permissions
+    """
+    def client(app):
+        test_client = app.test_client()
+        test_client.environ_base["HTTP_AUTHORIZATION"] = "Bearer " + auth.token()
+        return test_client
+
+    return client
+
+
+@pytest.fixture
+def client(app, client_for):
+    return client_for(app)
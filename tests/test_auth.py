@@ -0,0 +1,161 @@
+"""
+Caches of auth.py: signing keys, OAuth metadata and verified tokens
+"""
+import os
+import json
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import auth
+from auth import JWKSCache, OAuthMetadataCache, TokenCache
+from conftest import auth as local_auth
+
+
+class StubJWKSCache(JWKSCache):
+    """
+    Serves the key sets in `key_sets` one per fetch (the last one again once
+    they run out) and counts the fetches
+    """
+
+    def __init__(self, key_sets, delay=0, **kwargs):
+        super().__init__(url="stub://jwks", **kwargs)
+        self.key_sets = list(key_sets)
+        self.delay = delay
+        self.fetches = 0
+
+    def _fetch(self):
+        time.sleep(self.delay)
+        self.fetches += 1
+        return self.key_sets[min(self.fetches, len(self.key_sets)) - 1]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Replaces the monotonic clock of auth.py, advance it with clock.now += seconds
+    """
+    fake = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(auth, "time", SimpleNamespace(monotonic=lambda: fake.now, time=time.time))
+    return fake
+
+
+def test_jwks_concurrent_refresh_fetches_once():
+    cache = StubJWKSCache([{"old": "old key"}], delay=0.2, ttl=3600, min_refresh_interval=30)
+    barrier = threading.Barrier(8)
+    keys = []
+
+    def verify():
+        barrier.wait()
+        keys.append(cache.get_key("old"))
+
+    threads = [threading.Thread(target=verify) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.fetches == 1
+    assert keys == ["old key"] * 8
+
+
+def test_jwks_unknown_kid_refresh_is_rate_limited(clock):
+    cache = StubJWKSCache([{"old": "old key"}, {"new": "new key"}], ttl=3600, min_refresh_interval=30)
+    assert cache.get_key("old") == "old key"
+
+    # Within min_refresh_interval an unknown kid doesn't fetch again
+    clock.now += 10
+    assert cache.get_key("new") is None
+    assert cache.get_key("forged") is None
+    assert cache.fetches == 1
+
+
+def test_jwks_unknown_kid_refreshes(clock):
+    cache = StubJWKSCache([{"old": "old key"}, {"new": "new key"}], ttl=3600, min_refresh_interval=30)
+    assert cache.get_key("old") == "old key"
+
+    # The keys were rotated: the first unknown kid after the interval fetches them
+    clock.now += 31
+    assert cache.get_key("new") == "new key"
+    assert cache.fetches == 2
+    # The next unknown kid is limited again
+    clock.now += 1
+    assert cache.get_key("forged") is None
+    assert cache.fetches == 2
+
+
+def test_jwks_refresh_after_ttl(clock):
+    cache = StubJWKSCache([{"old": "old key"}, {"new": "new key"}], ttl=3600, min_refresh_interval=30)
+    cache.get_key("old")
+    clock.now += 3601
+    assert cache.get_key("old") is None
+    assert cache.fetches == 2
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+
+
+def test_oauth_metadata_local_copy(tmp_path):
+    source = tmp_path / "openid-configuration"
+    write_json(source, {"issuer": "https://tenant/"})
+    copy = tmp_path / "metadata.json"
+
+    assert OAuthMetadataCache(source.as_uri(), str(copy), ttl=60).get() == {"issuer": "https://tenant/"}
+    assert os.stat(copy).st_mode & 0o777 == 0o600
+
+    # A restarted process reads the copy, without fetching
+    source.unlink()
+    assert OAuthMetadataCache(source.as_uri(), str(copy), ttl=60).get() == {"issuer": "https://tenant/"}
+
+
+def test_oauth_metadata_ignores_copy_writable_by_others(tmp_path):
+    source = tmp_path / "openid-configuration"
+    write_json(source, {"issuer": "https://tenant/"})
+    copy = tmp_path / "metadata.json"
+    write_json(copy, {"issuer": "https://planted/"})
+    os.chmod(copy, 0o666)
+
+    assert OAuthMetadataCache(source.as_uri(), str(copy), ttl=60).get() == {"issuer": "https://tenant/"}
+
+
+def test_token_cache_hit():
+    token = local_auth.token()
+    payload = {"sub": "user", "exp": time.time() + 60, "permissions": ["read:movies"]}
+    cache = TokenCache(maxsize=2)
+    assert cache.get(token) is None
+    assert cache.put(token, payload) == frozenset(["read:movies"])
+    assert cache.get(token) == (payload, frozenset(["read:movies"]))
+    assert cache.stats() == {"size": 1, "maxsize": 2, "hits": 1, "misses": 1}
+
+
+def test_token_cache_evicts_expired_token():
+    cache = TokenCache(maxsize=2)
+    cache.put("token", {"exp": time.time() - 1})
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(maxsize=2)
+    exp = time.time() + 60
+    for token in ("first", "second"):
+        cache.put(token, {"exp": exp})
+    # A hit makes "first" the most recently used, "second" is evicted
+    assert cache.get("first") is not None
+    cache.put("third", {"exp": exp})
+    assert cache.stats()["size"] == 2
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+
+
+def test_token_cache_status(client):
+    # The client sends the same token every time, the second request is a hit
+    client.get("/status/auth")
+    before = client.get("/status/auth").get_json()["token_cache"]
+    after = client.get("/status/auth").get_json()["token_cache"]
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"]
@@ -0,0 +1,47 @@
+"""
+The response cache keeps serving from the database when its backend fails,
+and counts hits and misses from concurrent threads.
+"""
+import threading
+
+from cache import LRUCache, ResponseCache
+
+
+class BrokenBackend(LRUCache):
+    def get(self, key):
+        raise ConnectionError("cache down")
+
+    def set(self, key, value):
+        raise ConnectionError("cache down")
+
+    def delete(self, keys):
+        raise ConnectionError("cache down")
+
+    def clear(self):
+        raise ConnectionError("cache down")
+
+
+def test_backend_errors_are_logged(caplog):
+    cache = ResponseCache(BrokenBackend())
+    assert cache.get_or_load("key", lambda: "value") == "value"
+    cache.invalidate(movie_ids=[1])
+    cache.clear()
+    assert [record.getMessage() for record in caplog.records] == ["Cache unavailable: cache down"] * 3
+
+
+def test_counters_under_concurrency():
+    cache = ResponseCache(LRUCache(maxsize=10))
+    cache.get_or_load("key", lambda: "value")
+    threads, lookups = 8, 2000
+
+    def read():
+        for _ in range(lookups):
+            cache.get_or_load("key", lambda: "value")
+
+    workers = [threading.Thread(target=read) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (threads * lookups, 1)
@@ -0,0 +1,37 @@
+"""
+ETags and If-None-Match of the versioned cast and portfolio endpoints
+"""
+import pytest
+from sqlalchemy import insert
+
+from model import db, Movie, Actor, Cast
+
+
+@pytest.fixture
+def cast_client(app, client_for):
+    with app.app_context():
+        db.session.execute(insert(Movie.__table__).values(mov_id=1, mov_title="Movie"))
+        db.session.execute(insert(Actor.__table__).values(act_id=1, act_firstname="First", act_lastname="Last"))
+        db.session.execute(insert(Cast.__table__).values(mov_id=1, act_id=1, cas_role="Lead"))
+        db.session.commit()
+    return client_for(app)
+
+
+@pytest.mark.parametrize("path, fields, reordered, expected", [
+    ("/movie/1/cast", "cas_role,act_id", "act_id,cas_role,act_id", [{"act_id": 1, "cas_role": "Lead"}]),
+    ("/actor/1/casts", "role", "role,role", [{"role": "Lead"}]),
+    ("/actor/1/movies", "role", "role,role", [{"role": "Lead"}]),
+])
+def test_etag_depends_on_fieldset(cast_client, path, fields, reordered, expected):
+    etag = cast_client.get(path).headers["ETag"]
+    assert cast_client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    # Another fieldset is another representation
+    sparse = cast_client.get(path, query_string={"fields": fields}, headers={"If-None-Match": etag})
+    assert sparse.status_code == 200
+    assert sparse.get_json()["cast_list"] == expected
+    assert sparse.headers["ETag"] != etag
+
+    # The same fieldset in another order or with repeats has the same ETag
+    again = cast_client.get(path, query_string={"fields": reordered}, headers={"If-None-Match": sparse.headers["ETag"]})
+    assert again.status_code == 304
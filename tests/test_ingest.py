@@ -0,0 +1,46 @@
+"""
+An import that can't be read stops with a 400 and the counters up to the
+last committed chunk.
+"""
+import csv
+
+import pytest
+
+from model import db, Actor
+
+HEADER = "act_firstname,act_lastname\n"
+# Python 3.11 and later read NUL bytes, an oversized field fails on all versions
+OVERSIZED_ROW = "First," + "x" * (csv.field_size_limit() + 1) + "\n"
+
+
+def actor_rows(count):
+    return "".join(f"First,Last {number}\n" for number in range(1, count + 1))
+
+
+def test_unreadable_csv_is_a_client_error(app, client_for):
+    client = client_for(app)
+    body = HEADER + actor_rows(3) + OVERSIZED_ROW
+    # ingest reads in chunks of 5000, so nothing is committed before the bad row
+    response = client.post("/actors/import?format=csv", data=body.encode("utf-8"), content_type="text/csv")
+    assert response.status_code == 400
+    data = response.get_json()
+    assert data["success"] is False
+    assert "line 5" in data["error"]
+    assert data["import"]["position"] == 0
+    assert data["import"]["inserted"] == 0
+    with app.app_context():
+        assert db.session.query(Actor).count() == 0
+
+
+def test_unreadable_csv_keeps_committed_chunks(app):
+    from ingest import IngestError, ingest
+
+    lines = (HEADER + actor_rows(4) + OVERSIZED_ROW).splitlines(keepends=True)
+    with app.app_context():
+        with pytest.raises(IngestError) as raised:
+            ingest(lines, "csv", "actors", chunk_size=2)
+        assert raised.value.status_code == 400
+        assert "line 6" in str(raised.value)
+        assert raised.value.stats.position == 4
+        assert raised.value.stats.inserted == 4
+        assert db.session.query(Actor).count() == 4
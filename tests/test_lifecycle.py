@@ -0,0 +1,16 @@
+from flask import Flask
+
+from lifecycle import start_in_serving_process
+
+
+def test_start_runs_once_at_first_request():
+    app = Flask(__name__)
+    calls = []
+    start_in_serving_process(app, lambda: calls.append(1))
+    app.add_url_rule("/", "index", lambda: "")
+
+    assert calls == []
+    client = app.test_client()
+    for _ in range(3):
+        client.get("/")
+    assert calls == [1]
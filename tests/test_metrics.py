@@ -0,0 +1,35 @@
+"""
+The monitoring endpoints are only served to tokens with read:metrics or to METRICS_TOKEN.
+"""
+import pytest
+
+import auth
+from conftest import auth as local_auth
+
+MONITORING_PATHS = ["/metrics", "/status/pool", "/status/cache", "/status/graph", "/status/auth"]
+
+
+@pytest.mark.parametrize("path", MONITORING_PATHS)
+def test_monitoring_needs_token(app, path):
+    assert app.test_client().get(path).status_code == 401
+
+
+@pytest.mark.parametrize("path", MONITORING_PATHS)
+def test_monitoring_needs_permission(app, path):
+    token = local_auth.token(permissions=["read:movies"])
+    response = app.test_client().get(path, headers={"Authorization": "Bearer " + token})
+    assert response.status_code == 401
+    assert response.get_json()["code"] == "invalid_permissions"
+
+
+@pytest.mark.parametrize("path", MONITORING_PATHS)
+def test_monitoring_with_permission(client, path):
+    assert client.get(path).status_code == 200
+
+
+@pytest.mark.parametrize("path", MONITORING_PATHS)
+def test_monitoring_with_metrics_token(app, monkeypatch, path):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scraper-secret")
+    client = app.test_client()
+    assert client.get(path, headers={"Authorization": "Bearer scraper-secret"}).status_code == 200
+    assert client.get(path, headers={"Authorization": "Bearer other-secret"}).status_code == 401
@@ -0,0 +1,118 @@
+"""
+The read endpoints run a fixed number of SQL statements, however many rows
+they return, and the lookups by act_id use the casts index.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, insert
+
+from model import db, Movie, Actor, Cast
+
+SMALL, LARGE = 1, 200
+
+
+@contextmanager
+def count_statements(app):
+    """
+    Counts the statements executed on the primary database inside the block
+    """
+    counter = {"statements": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["statements"] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def seeded_app(app):
+    """
+    Movie 1 has SMALL cast members, movie 2 LARGE ones. Actor 2 has SMALL
+    credits, actor 1 has LARGE more in movies 3 and up.
+    """
+    movie_ids = range(1, LARGE + 3)
+    with app.app_context():
+        db.session.execute(insert(Movie.__table__), [{"mov_id": mov_id, "mov_title": f"Movie {mov_id}"} for mov_id in movie_ids])
+        db.session.execute(insert(Actor.__table__), [
+            {"act_id": act_id, "act_firstname": "First", "act_lastname": f"Last {act_id}"} for act_id in range(1, LARGE + 1)])
+        db.session.execute(insert(Cast.__table__), [{"mov_id": 1, "act_id": 1, "cas_role": "Lead"}] + [
+            {"mov_id": 2, "act_id": act_id, "cas_role": f"Role {act_id}"} for act_id in range(1, LARGE + 1)] + [
+            {"mov_id": mov_id, "act_id": 1, "cas_role": "Regular"} for mov_id in movie_ids[2:]])
+        db.session.commit()
+    return app
+
+
+def test_movie_cast_statements_constant(seeded_app, client_for):
+    client = client_for(seeded_app)
+    counts = {}
+    for mov_id, size in ((1, SMALL), (2, LARGE)):
+        with count_statements(seeded_app) as counter:
+            response = client.get(f"/movie/{mov_id}/cast")
+        assert response.status_code == 200
+        assert len(response.get_json()["cast_list"]) == size
+        counts[size] = counter["statements"]
+    assert 0 < counts[SMALL] == counts[LARGE]
+
+
+@pytest.mark.parametrize("path", ["/actor/{act_id}/casts", "/actor/{act_id}/movies"])
+def test_actor_portfolio_statements_constant(seeded_app, client_for, path):
+    client = client_for(seeded_app)
+    counts = {}
+    for act_id, size in ((2, SMALL), (1, LARGE + 2)):
+        with count_statements(seeded_app) as counter:
+            response = client.get(path.format(act_id=act_id))
+        assert response.status_code == 200
+        assert len(response.get_json()["cast_list"]) == size
+        counts[size] = counter["statements"]
+    assert 0 < counts[SMALL] == counts[LARGE + 2]
+
+
+def query_plan(connection, statement, parameters):
+    """
+    The SQLite query plan of a statement, as one string
+    """
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def test_act_id_lookups_use_index(seeded_app):
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    with seeded_app.app_context():
+        from model import queryPortfolioByActor
+        from bulk import delete_actors
+        engine = db.engine
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            # The actor portfolio and the lookup of an actor's movies (actor delete)
+            queryPortfolioByActor(1)
+            delete_actors([1])
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+            db.session.rollback()
+
+        lookups = [(statement, parameters) for statement, parameters in captured if "casts" in statement]
+        assert len(lookups) == 2
+        with engine.connect() as connection:
+            for statement, parameters in lookups:
+                plan = query_plan(connection, statement, parameters)
+                assert "ix_casts_act_id_mov_id" in plan, plan
+
+
+def test_cast_lookup_is_one_statement(seeded_app):
+    # The movie and actor relationships of a cast are not loaded along
+    with seeded_app.app_context():
+        with count_statements(seeded_app) as counter:
+            cast = Cast.query.filter_by(mov_id=2, act_id=1).first()
+        assert cast is not None
+        assert counter["statements"] == 1
@@ -0,0 +1,106 @@
+"""
+Read-replica routing (routing.py) with two SQLite files standing in for the
+primary and a replica. Each holds a different movie, so the title in the
+response tells which database served the read.
+"""
+import pytest
+from sqlalchemy import event, insert
+
+from conftest import sqlite_url
+from model import db, Movie
+from routing import REPLICA_STICKY_COOKIE, replica_router
+
+
+@pytest.fixture(autouse=True)
+def fresh_router(monkeypatch):
+    # Health results are kept per bind key, across apps
+    monkeypatch.setattr(replica_router, "_health", {})
+
+
+def add_movie(app, bind_key, title):
+    with app.app_context():
+        engine = db.engines[bind_key]
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(insert(Movie.__table__).values(mov_title=title))
+
+
+def titles(client):
+    response = client.get("/movies")
+    assert response.status_code == 200
+    return [movie["mov_title"] for movie in response.get_json()["movies"]]
+
+
+@pytest.fixture
+def replicated_app(make_app, tmp_path):
+    app = make_app(sqlite_url(tmp_path, "primary"), [sqlite_url(tmp_path, "replica")])
+    add_movie(app, None, "On primary")
+    add_movie(app, "replica_0", "On replica")
+    return app
+
+
+def test_read_only_handler_reads_from_replica(replicated_app, client_for):
+    assert titles(client_for(replicated_app)) == ["On replica"]
+
+
+def test_unhealthy_replica_falls_back_to_primary(make_app, tmp_path, client_for):
+    # SQLite can't create a file in a directory that doesn't exist
+    app = make_app(sqlite_url(tmp_path, "primary"), ["sqlite:///" + str(tmp_path / "missing" / "replica.db")])
+    add_movie(app, None, "On primary")
+
+    client = client_for(app)
+    assert titles(client) == ["On primary"]
+    with app.app_context():
+        assert replica_router.status(db.engines) == {"replica_0": False}
+
+
+def test_writer_reads_from_primary_after_write(replicated_app, client_for):
+    writer = client_for(replicated_app)
+    response = writer.post("/movie/create", json={"mov_title": "New", "mov_release": 2000, "mov_language": "en"})
+    assert response.status_code == 201
+    assert REPLICA_STICKY_COOKIE in response.headers.get("Set-Cookie", "")
+
+    # The writer sees its own write, other clients still read from the replica
+    assert titles(writer) == ["On primary", "New"]
+    assert titles(client_for(replicated_app)) == ["On replica"]
+
+
+def test_expired_sticky_cookie_reads_from_replica(replicated_app, client_for):
+    client = client_for(replicated_app)
+    client.set_cookie(REPLICA_STICKY_COOKIE, "1.0")
+    assert titles(client) == ["On replica"]
+
+
+def test_reads_without_write_set_no_cookie(replicated_app, client_for):
+    response = client_for(replicated_app).get("/movies")
+    assert REPLICA_STICKY_COOKIE not in response.headers.get("Set-Cookie", "")
+
+
+def test_request_reads_from_one_replica(make_app, tmp_path, client_for):
+    app = make_app(sqlite_url(tmp_path, "primary"),
+                   [sqlite_url(tmp_path, "replica_a"), sqlite_url(tmp_path, "replica_b")])
+    for bind_key in (None, "replica_0", "replica_1"):
+        add_movie(app, bind_key, "Movie")
+
+    served_by = []
+    with app.app_context():
+        engines = [db.engines["replica_0"], db.engines["replica_1"]]
+
+    def listener(engine):
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            served_by.append(engine.url.database)
+        return before_cursor_execute
+
+    listeners = [(engine, listener(engine)) for engine in engines]
+    for engine, fn in listeners:
+        event.listen(engine, "before_cursor_execute", fn)
+    try:
+        client = client_for(app)
+        for _ in range(3):
+            served_by.clear()
+            # Reads the version of the movie, then its cast
+            assert client.get("/movie/1/cast").status_code == 200
+            assert len(served_by) >= 2 and len(set(served_by)) == 1
+    finally:
+        for engine, fn in listeners:
+            event.remove(engine, "before_cursor_execute", fn)
@@ -0,0 +1,43 @@
+"""
+Prefix search (/search/movies, /search/actors) on SQLite
+"""
+import pytest
+from sqlalchemy import insert
+
+from model import db, Movie, Actor
+
+
+@pytest.fixture
+def search_client(app, client_for):
+    with app.app_context():
+        db.session.execute(insert(Movie.__table__), [{"mov_title": title} for title in ("Amélie", "Alien", "Élite")])
+        db.session.execute(insert(Actor.__table__), [
+            {"act_firstname": "Émile", "act_lastname": "Zola"}, {"act_firstname": "Emma", "act_lastname": "Stone"}])
+        db.session.commit()
+    return client_for(app)
+
+
+def movie_titles(client, prefix):
+    response = client.get("/search/movies", query_string={"q": prefix})
+    assert response.status_code == 200
+    return [movie["mov_title"] for movie in response.get_json()["movies"]]
+
+
+def actor_names(client, prefix):
+    response = client.get("/search/actors", query_string={"q": prefix})
+    assert response.status_code == 200
+    return [actor["act_firstname"] for actor in response.get_json()["actors"]]
+
+
+def test_search_ignores_ascii_case(search_client):
+    assert movie_titles(search_client, "a") == ["Alien", "Amélie"]
+    assert movie_titles(search_client, "AMé") == ["Amélie"]
+    assert actor_names(search_client, "zO") == ["Émile"]
+
+
+def test_search_non_ascii_prefix(search_client):
+    assert movie_titles(search_client, "Él") == ["Élite"]
+    assert actor_names(search_client, "ÉMILE z") == ["Émile"]
+    # SQLite's lower() leaves non-ASCII letters as they are
+    assert actor_names(search_client, "é") == []
+    assert actor_names(search_client, "E") == ["Emma"]